@@ -0,0 +1,105 @@
+# =============================================================================
+# FRAME PIPELINE BENCHMARK - Decode, Calibrate and Rescale per Sensor Type
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Times frame.process() on synthetic captures for every sensor type
+#          and compares it with the equivalent pure Python line loop.
+#
+# Usage:
+#   python3 benchmarks/frame_pipeline.py                 # synthetic sensor types
+#   python3 benchmarks/frame_pipeline.py --installed     # types from generated_tables
+#
+# Measurement:
+#   - A synthetic capture of --lines scan lines with random pixels is built
+#     for every sensor type, with a calibration blob of
+#     lines_per_calibration_data / repeat_multiplier lines
+#   - Best per-frame time of several rounds; the Python reference is checked
+#     to produce the same image
+# =============================================================================
+
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python-modules')
+
+# (sensor_type, bytes_per_line, repeat_multiplier, lines_per_calibration_data, line_width, scale_mul, scale_div)
+SYNTHETIC_TYPES = (
+    (0x00b5, 0x78, 2, 112, 0x70, 1, 1),
+    (0x0199, 0x78, 2, 112, 0x70, 2, 1),
+    (0x00db, 0x98, 4, 144, 0x90, 3, 2),
+    (0x0885, 0x60, 1, 80, 0x58, 1, 2),
+)
+
+
+def reference(raw: bytes, info) -> list:
+    """Pure Python pipeline (line loop, per pixel calibration and rescale)."""
+    header = info.bytes_per_line - info.line_width
+    calib = info.calibration_blob
+    calib_width = info.bytes_per_line if len(calib) % info.bytes_per_line == 0 else info.line_width
+    calib_lines = [calib[i:i + calib_width] for i in range(0, len(calib), calib_width)]
+    calib_lines = [l for l in calib_lines for _ in range(info.repeat_multiplier)]
+
+    image = []
+    for n in range(len(raw) // info.bytes_per_line):
+        line = raw[n * info.bytes_per_line:(n + 1) * info.bytes_per_line]
+        c = calib_lines[n % info.lines_per_calibration_data % len(calib_lines)]
+        if calib_width == info.bytes_per_line:
+            line = bytes(max(p - q, 0) for p, q in zip(line, c))[header:]
+        else:
+            line = bytes(max(p - q, 0) for p, q in zip(line[header:], c))
+        image.append(line)
+
+    height = len(image) * info.scale_mul // info.scale_div
+    width = info.line_width * info.scale_mul // info.scale_div
+    return [[image[y * info.scale_div // info.scale_mul][x * info.scale_div // info.scale_mul]
+             for x in range(width)] for y in range(height)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Frame pipeline benchmark')
+    parser.add_argument('--installed', action='store_true', help='use the installed package and generated_tables')
+    parser.add_argument('--lines', type=int, default=1024, help='scan lines per synthetic capture')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.installed:
+            # The source directory is the package itself, expose it under its package name
+            os.symlink(os.path.abspath(SOURCE_DIR), os.path.join(tmp, 'validitysensor'))
+            sys.path.insert(0, tmp)
+        from validitysensor import frame
+        from validitysensor.table_types import SensorTypeInfo
+
+    rnd = np.random.RandomState(0)
+
+    if args.installed:
+        types = [t for t in SensorTypeInfo.get_many(i.sensor_type for i in SensorTypeInfo.table) if t is not None]
+    else:
+        types = []
+        for sensor_type, bpl, repeat, lines, width, mul, div in SYNTHETIC_TYPES:
+            calib = rnd.randint(0, 64, (lines // repeat) * bpl).astype(np.uint8).tobytes()
+            types.append(SensorTypeInfo(sensor_type, bpl, repeat, lines, width, mul, div, calib.hex()))
+
+    print('%-8s %10s %8s %12s %12s %8s' % ('type', 'frame', 'scale', 'numpy', 'python', 'speedup'))
+    for info in types:
+        raw = rnd.randint(0, 256, args.lines * info.bytes_per_line).astype(np.uint8).tobytes()
+
+        image = frame.process(raw, info)
+        if image.tolist() != reference(raw, info):
+            raise Exception('Pipeline mismatch for sensor type 0x%04x' % info.sensor_type)
+
+        fast = min(timeit.repeat(lambda: frame.process(raw, info), number=20, repeat=args.rounds)) / 20
+        slow = min(timeit.repeat(lambda: reference(raw, info), number=1, repeat=max(args.rounds // 2, 1)))
+
+        print('0x%04x %6dx%-4d %4d/%-3d %9.1f us %9.1f ms %7.0fx' %
+              (info.sensor_type, args.lines, info.line_width, info.scale_mul, info.scale_div,
+               fast * 1e6, slow * 1e3, slow / fast))
+
+
+if __name__ == '__main__':
+    main()
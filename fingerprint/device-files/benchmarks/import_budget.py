@@ -0,0 +1,140 @@
+# =============================================================================
+# IMPORT-TIME BUDGET - Cold Import Regression Check
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Measures the cold import time of the validitysensor package with
+#          `python -X importtime` and fails if it exceeds a budget, or if a
+#          heavy dependency is loaded by a module that should not need it.
+#
+# Operational Context:
+#   The PAM helper starts a fresh interpreter on every login attempt, so the
+#   package import time is latency the user waits through. Modules that only
+#   provide constants (fingerprint_constants, firmware_tables) and the
+#   transport module itself must not pull in cryptography or pyusb; those are
+#   imported on first use.
+#
+# Usage:
+#   python3 benchmarks/import_budget.py                     # source tree
+#   python3 benchmarks/import_budget.py --installed         # site-packages
+#   python3 benchmarks/import_budget.py --budget-ms 40 --runs 9
+#
+# Budget:
+#   - The default is sized for the EliteBook; most of it is stdlib (logging,
+#     typing, enum). Eager cryptography or pyusb imports are caught by the
+#     forbidden-module check regardless of machine speed
+#
+# Measurement:
+#   - Every run is a new interpreter (no module cache in memory)
+#   - The time of a run is the sum of the cumulative times of all top-level
+#     validitysensor.* imports; the median over all runs is compared
+#   - Exit status 1 if over budget or a forbidden module was imported
+# =============================================================================
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import typing
+
+PACKAGE = 'validitysensor'
+
+# Modules imported by the probe interpreter
+DEFAULT_MODULES = ('fingerprint_constants', 'firmware_tables', 'devices', 'usb')
+
+# Heavy dependencies that must stay unloaded after importing DEFAULT_MODULES
+DEFAULT_FORBIDDEN = ('cryptography', 'usb.core')
+
+DEFAULT_BUDGET_MS = 75.0
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python-modules')
+
+# One line of -X importtime output: self [us], cumulative [us], indented name
+ImportLine = typing.Tuple[int, int, int, str]
+
+
+def parse_importtime(stderr: str) -> typing.List[ImportLine]:
+    """
+    Parse `-X importtime` output.
+
+    Returns:
+        List of (self_us, cumulative_us, depth, module name)
+    """
+    lines = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # header line
+        name = fields[2].rstrip()
+        stripped = name.lstrip()
+        depth = (len(name) - len(stripped) - 1) // 2
+        lines.append((int(fields[0]), int(fields[1]), depth, stripped))
+    return lines
+
+
+def run_once(modules: typing.Sequence[str], env: typing.Dict[str, str]) -> typing.List[ImportLine]:
+    code = 'import ' + ', '.join('%s.%s' % (PACKAGE, m) for m in modules)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if proc.returncode != 0:
+        raise Exception('Probe import failed:\n%s' % proc.stderr[-2000:])
+    return parse_importtime(proc.stderr)
+
+
+def package_time_us(lines: typing.List[ImportLine]) -> int:
+    """Sum of the cumulative times of the top-level package imports."""
+    return sum(cum for _, cum, depth, name in lines
+               if depth == 0 and (name == PACKAGE or name.startswith(PACKAGE + '.')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the cold import time of %s' % PACKAGE)
+    parser.add_argument('--installed', action='store_true', help='measure the installed package, not the source tree')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--module', action='append', dest='modules', help='module to import (repeatable)')
+    parser.add_argument('--forbid', action='append', help='module that must not be imported (repeatable)')
+    args = parser.parse_args()
+
+    modules = args.modules or DEFAULT_MODULES
+    forbidden = args.forbid or DEFAULT_FORBIDDEN
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        if not args.installed:
+            # The source directory is the package itself, expose it under its package name
+            os.symlink(os.path.abspath(SOURCE_DIR), os.path.join(tmp, PACKAGE))
+            env['PYTHONPATH'] = os.pathsep.join([tmp] + [p for p in [env.get('PYTHONPATH')] if p])
+
+        runs = [run_once(modules, env) for _ in range(args.runs)]
+
+    times = [package_time_us(lines) / 1000.0 for lines in runs]
+    median = statistics.median(times)
+
+    loaded = set(name for lines in runs for _, _, _, name in lines)
+    leaked = [m for m in forbidden if m in loaded]
+
+    print('Cold import of %s: median %.1f ms, min %.1f ms, max %.1f ms (budget %.1f ms, %d runs)' %
+          (', '.join(modules), median, min(times), max(times), args.budget_ms, len(times)))
+
+    slowest = sorted(runs[-1], key=lambda l: l[0], reverse=True)[:10]
+    print('Slowest imports (self time, last run):')
+    for self_us, cum_us, _, name in slowest:
+        print('  %8.2f ms  %8.2f ms cumulative  %s' % (self_us / 1000.0, cum_us / 1000.0, name))
+
+    failed = False
+    if leaked:
+        print('FAIL: heavy modules imported eagerly: %s' % ', '.join(leaked))
+        failed = True
+    if median > args.budget_ms:
+        print('FAIL: import time over budget')
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+# =============================================================================
+# SENSOR TABLE FOOTPRINT - Memory and Load Time of the Generated Tables
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Compares loading the SensorTypeInfo / SensorCaptureProg tables with
+#          the compact, lazily decoded classes of table_types.py against the
+#          previous eager representation (per-instance __dict__, every blob
+#          unhexlified in the constructor).
+#
+# Operational Context:
+#   generated_tables holds an entry for every known sensor, but a machine has
+#   exactly one sensor, so nearly all decoded blobs were wasted work.
+#
+# Usage:
+#   python3 benchmarks/table_memory.py                  # synthetic tables
+#   python3 benchmarks/table_memory.py --installed      # real generated_tables
+#
+# Measurement:
+#   - Synthetic mode builds tables sized like generated_tables (see the
+#     defaults) with both representations, reporting tracemalloc peak/retained
+#     memory and the best construction time of several rounds
+#   - Installed mode imports validitysensor.generated_tables in a fresh
+#     interpreter and reports its import time and retained memory
+# =============================================================================
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing
+from binascii import unhexlify
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python-modules')
+
+
+class EagerSensorTypeInfo:
+    """Previous representation of SensorTypeInfo."""
+
+    def __init__(self, sensor_type, bytes_per_line, repeat_multiplier, lines_per_calibration_data, line_width,
+                 scale_mul, scale_div, calibration_blob):
+        self.sensor_type = sensor_type
+        self.repeat_multiplier = repeat_multiplier
+        self.lines_per_calibration_data = lines_per_calibration_data
+        self.line_width = line_width
+        self.bytes_per_line = bytes_per_line
+        self.scale_mul = scale_mul
+        self.scale_div = scale_div
+        self.calibration_blob = unhexlify(calibration_blob)
+
+
+class EagerSensorCaptureProg:
+    """Previous representation of SensorCaptureProg."""
+
+    def __init__(self, major, minor, build, u1, dev_type, a0, a1, blobs):
+        self.major = major
+        self.minor = minor
+        self.build = build
+        self.u1 = u1
+        self.dev_type = dev_type
+        self.a0 = a0
+        self.a1 = a1
+        self.blobs = [unhexlify(b) for b in blobs]
+
+
+def synthetic_rows(sensor_types: int, calibration_bytes: int, progs: int, prog_blobs: int, blob_bytes: int):
+    rnd = random.Random(0)
+
+    def hexblob(n):
+        return bytes(rnd.getrandbits(8) for _ in range(n)).hex()
+
+    types = [(0x100 + n, 0x78, 3, 8, 0x70, 1, 1, hexblob(calibration_bytes)) for n in range(sensor_types)]
+    captures = [(6, 7, 0x30, 0xffff, 0x100 + n % sensor_types, 0xffff, n % 4,
+                 [hexblob(blob_bytes) for _ in range(prog_blobs)]) for n in range(progs)]
+    return types, captures
+
+
+def measure(type_cls, prog_cls, types, captures, rounds: int) -> typing.Tuple[float, int, int]:
+    """
+    Build both tables.
+
+    Returns:
+        (best build time in seconds, tracemalloc peak bytes, retained bytes)
+    """
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        [type_cls(*row) for row in types]
+        [prog_cls(*row) for row in captures]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    tables = ([type_cls(*row) for row in types], [prog_cls(*row) for row in captures])
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del tables
+
+    return best, peak, retained
+
+
+def run_synthetic(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        # The source directory is the package itself, expose it under its package name
+        os.symlink(os.path.abspath(SOURCE_DIR), os.path.join(tmp, 'validitysensor'))
+        sys.path.insert(0, tmp)
+        from validitysensor.table_types import SensorTypeInfo, SensorCaptureProg
+        sys.path.remove(tmp)
+
+    types, captures = synthetic_rows(args.sensor_types, args.calibration_bytes, args.progs, args.prog_blobs,
+                                     args.blob_bytes)
+
+    print('Tables: %d sensor types (%d byte calibration blobs), %d capture programs (%d x %d byte blobs)' %
+          (args.sensor_types, args.calibration_bytes, args.progs, args.prog_blobs, args.blob_bytes))
+    print('%-8s %12s %12s %12s' % ('', 'build', 'peak', 'retained'))
+
+    results = {}
+    for name, type_cls, prog_cls in (('eager', EagerSensorTypeInfo, EagerSensorCaptureProg),
+                                     ('compact', SensorTypeInfo, SensorCaptureProg)):
+        elapsed, peak, retained = measure(type_cls, prog_cls, types, captures, args.rounds)
+        results[name] = (elapsed, retained)
+        print('%-8s %9.2f ms %9.1f KiB %9.1f KiB' % (name, elapsed * 1000, peak / 1024, retained / 1024))
+
+    # Retained memory excludes the hex strings themselves, which the
+    # generated_tables module source holds in both representations
+    (eager_t, eager_m), (compact_t, compact_m) = results['eager'], results['compact']
+    print('compact: %.1fx faster to build, %.1f KiB (%.0f%%) less retained memory' %
+          (eager_t / compact_t, (eager_m - compact_m) / 1024, 100.0 * (eager_m - compact_m) / eager_m))
+
+
+def run_installed(args):
+    code = ('import time, tracemalloc; tracemalloc.start(); t = time.perf_counter(); '
+            'import validitysensor.generated_tables; t = time.perf_counter() - t; '
+            'print("%.2f ms, %.1f KiB retained" % (t * 1000, tracemalloc.get_traced_memory()[0] / 1024))')
+    for _ in range(args.rounds):
+        out = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        print('import validitysensor.generated_tables: ' + out.stdout.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sensor table memory and load time')
+    parser.add_argument('--installed', action='store_true', help='import the installed generated_tables')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--sensor-types', type=int, default=40)
+    parser.add_argument('--calibration-bytes', type=int, default=4096)
+    parser.add_argument('--progs', type=int, default=300)
+    parser.add_argument('--prog-blobs', type=int, default=4)
+    parser.add_argument('--blob-bytes', type=int, default=256)
+    args = parser.parse_args()
+
+    if args.installed:
+        run_installed(args)
+    else:
+        run_synthetic(args)
+
+
+if __name__ == '__main__':
+    main()
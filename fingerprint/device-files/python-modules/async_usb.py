@@ -0,0 +1,125 @@
+# =============================================================================
+# ASYNC USB TRANSPORT - Coroutine Interface for Validity Sensors Devices
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Provides asyncio coroutine versions of Usb.cmd(), Usb.read_82()
+#          and Usb.wait_int() so that a daemon can keep the interrupt and data
+#          endpoints in flight while commands are being exchanged.
+#
+# Operational Context:
+#   The synchronous Usb transport runs every phase in strict order: while
+#   wait_int() blocks on the interrupt endpoint nothing else can be sent.
+#   AsyncUsb wraps an existing Usb instance and gives every endpoint pipe its
+#   own worker, so transfers on different endpoints overlap.
+#
+# Endpoint Pipes:
+#   - Command pipe: Endpoint 1 (write) + Endpoint 129 (response read)
+#   - Data pipe: Endpoint 130 (fingerprint image data)
+#   - Interrupt pipe: Endpoint 131 (device events)
+#
+# Implementation Notes:
+#   - pyusb exposes only synchronous transfers, so each pipe is driven by a
+#     dedicated single-thread executor (libusb allows concurrent synchronous
+#     transfers on different endpoints of the same device handle)
+#   - One worker per pipe keeps transfers on the same pipe strictly ordered
+#   - The command write and its response read are issued as one unit, so
+#     responses can never be paired with the wrong command
+# =============================================================================
+
+import asyncio
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from .usb import Usb, usb as default_usb
+
+# =============================================================================
+# ASYNC USB TRANSPORT CLASS
+# =============================================================================
+# Purpose: Coroutine wrapper around a synchronous Usb transport
+#
+# Usage:
+#   ausb = AsyncUsb()
+#   interrupt = asyncio.ensure_future(ausb.wait_int())  # stays in flight
+#   rsp = await ausb.cmd(unhexlify('01'))               # runs concurrently
+#   event = await interrupt
+#
+# Cancellation:
+#   - Cancelling a pending wait_int() task also cancels the blocking wait in
+#     the worker thread, so the interrupt pipe becomes free again; the cancel
+#     token is taken before the wait is queued, so this also holds when the
+#     task is cancelled before the worker started the wait
+#   - An interrupt the worker dequeued for a task that was cancelled in the
+#     meantime is put back for the next wait_int()
+#   - cmd() and read_82() transfers cannot be aborted mid-flight; they finish
+#     (or time out) in their worker even if the awaiting task is cancelled
+# =============================================================================
+class AsyncUsb:
+    def __init__(self, usb: typing.Optional[Usb] = None):
+        """
+        Create an asyncio transport on top of a synchronous Usb transport.
+
+        Args:
+            usb: Opened Usb instance (defaults to the module-level usb singleton)
+        """
+        self.usb = usb if usb is not None else default_usb
+        self._cmd_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='usb-cmd')
+        self._data_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='usb-ep130')
+        self._int_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='usb-ep131')
+
+    async def cmd(self, out: typing.Union[bytes, typing.Callable[[], bytes]]):
+        """
+        Send a command on endpoint 1 and await its response on endpoint 129.
+
+        Args:
+            out: Command bytes or a callable returning them (lazy blobs)
+
+        Returns:
+            bytes: Raw response (status code in the first 2 bytes)
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._cmd_pool, self.usb.cmd, out)
+
+    async def read_82(self):
+        """
+        Await one image data transfer from endpoint 130.
+
+        Returns:
+            bytes: Image data, or None if the transfer failed
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._data_pool, self.usb.read_82)
+
+    async def wait_int(self):
+        """
+        Await the next interrupt from endpoint 131.
+
+        Returns:
+            bytes: Interrupt payload
+
+        Raises:
+            CancelledException: If Usb.cancel() was called while waiting
+            asyncio.CancelledError: If the awaiting task was cancelled
+        """
+        loop = asyncio.get_running_loop()
+        fut = loop.run_in_executor(self._int_pool, self.usb.wait_int, self.usb.cancel_token())
+        try:
+            return await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            # Release the worker thread, otherwise the interrupt pipe stays busy
+            self.usb.cancel()
+            fut.add_done_callback(self._abandoned_wait)
+            raise
+
+    def _abandoned_wait(self, fut: asyncio.Future):
+        # Retrieve the outcome of a wait whose task was cancelled, so asyncio
+        # does not log CancelledException as never retrieved, and keep an
+        # interrupt it received for the next waiter
+        if fut.cancelled() or fut.exception() is not None:
+            return
+        self.usb.requeue_int(fut.result())
+
+    def close(self):
+        """Stop the pipe workers (the underlying Usb is left open)."""
+        self.usb.cancel()
+        for pool in (self._cmd_pool, self._data_pool, self._int_pool):
+            pool.shutdown(wait=False)
@@ -0,0 +1,249 @@
+# =============================================================================
+# BINARY BLOB STORE - Precompiled, Memory-Mapped Firmware Blobs
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Compiles the hex-encoded blobs of every blobs_XX module into one
+#          indexed binary file and serves them at runtime as zero-copy slices
+#          of a read-only memory mapping.
+#
+# Operational Context:
+#   blobs_XX modules keep multi-kilobyte blobs as hex text that util.unhex()
+#   decodes at import time, which costs startup CPU and keeps both the hex
+#   and the binary copy in memory. With a compiled store installed, the blob
+#   loader (blobs.py) takes blobs from the mapping instead and the blobs_XX
+#   modules are never imported.
+#
+# Build Step:
+#   python -m validitysensor.blob_store build /usr/share/python-validity/blobs.bin
+#
+# File Format (little-endian):
+#   - Header: magic 'VBLB', version (u16), entry count (u16)
+#   - Index: one entry per (device, blob):
+#       vendor (u16), product (u16), name (32 bytes, NUL padded),
+#       offset (u32), length (u32), SHA-256 of the blob (32 bytes),
+#       SHA-256 of the blobs_XX source file it was built from (32 bytes)
+#   - Data: blobs back to back, offsets relative to the start of the file
+#
+# Integrity:
+#   - Every blob is checked against its SHA-256 the first time it is served
+#
+# Staleness:
+#   - The blob checksums only prove the file is intact. After an upgrade of
+#     the blobs_XX modules without a rebuild, the source digest differs from
+#     the installed module; the blob loader then warns and falls back to the
+#     module (see BlobRegistry in blobs.py)
+#   - A store of an older format version is ignored with a warning
+#
+# Compatibility:
+#   - BlobStore.get() returns a memoryview; slicing, len(), hexlify(), bytes()
+#     and `bytes + view` work, but `view + bytes` does not. The blob loader
+#     therefore hands out bytes and keeps views opt-in (blobs.load_blob_view())
+# =============================================================================
+
+import logging
+import mmap
+import os
+import sys
+import threading
+import typing
+from hashlib import sha256
+from struct import pack, unpack_from, calcsize
+
+MAGIC = b'VBLB'
+VERSION = 2
+HEADER = '<4sHH'
+ENTRY = '<HH32sII32s32s'
+
+DEFAULT_STORE_PATH = '/usr/share/python-validity/blobs.bin'
+
+# Source digest of blobs built from a module without a source file
+NO_SOURCE = bytes(32)
+
+BlobKey = typing.Tuple[int, int, str]
+
+
+def source_digest(module_name: str) -> typing.Optional[bytes]:
+    """
+    SHA-256 of the source file of a blobs_XX module, without importing it.
+
+    Args:
+        module_name: Module name relative to this package (e.g. 'blobs_92')
+
+    Returns:
+        Digest, or None if the module is not installed
+    """
+    from importlib.util import find_spec
+
+    try:
+        spec = find_spec('.' + module_name, __package__)
+    except ImportError:
+        return None
+    if spec is None or not spec.has_location or spec.origin is None:
+        return None
+
+    with open(spec.origin, 'rb') as f:
+        return sha256(f.read()).digest()
+
+
+class BlobStore:
+    def __init__(self, path: str):
+        """
+        Map a compiled blob store.
+
+        Args:
+            path: Store file written by build()
+
+        Raises:
+            Exception: If the file is not a blob store of a supported version
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = unpack_from(HEADER, self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise Exception('Not a blob store (or unsupported version): %s' % path)
+
+        self._index: typing.Dict[BlobKey, typing.Tuple[int, int, bytes]] = {}
+        self._sources: typing.Dict[typing.Tuple[int, int], bytes] = {}
+        pos = calcsize(HEADER)
+        for _ in range(count):
+            vendor, product, name, offset, length, digest, source = unpack_from(ENTRY, self._map, pos)
+            self._index[(vendor, product, name.rstrip(b'\0').decode())] = (offset, length, digest)
+            self._sources[(vendor, product)] = source
+            pos += calcsize(ENTRY)
+
+        self._verified: typing.Set[BlobKey] = set()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: BlobKey) -> bool:
+        return key in self._index
+
+    def keys(self) -> typing.List[BlobKey]:
+        return list(self._index)
+
+    def source(self, vendor: int, product: int) -> typing.Optional[bytes]:
+        """SHA-256 of the blobs_XX source file the blobs of a device were built from."""
+        source = self._sources.get((vendor, product))
+        return None if source == NO_SOURCE else source
+
+    def get(self, vendor: int, product: int, name: str) -> typing.Optional[memoryview]:
+        """
+        Zero-copy view of one blob.
+
+        Args:
+            vendor: USB vendor ID of the device
+            product: USB product ID of the device
+            name: Blob name (e.g. 'init_hardcoded')
+
+        Returns:
+            memoryview into the mapped file, or None if the store has no such blob
+
+        Raises:
+            Exception: If the blob does not match its checksum
+        """
+        key = (vendor, product, name)
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+
+        offset, length, digest = entry
+        view = memoryview(self._map)[offset:offset + length]
+
+        if key not in self._verified:
+            if sha256(view).digest() != digest:
+                raise Exception('Blob store checksum mismatch: %04x:%04x %s' % key)
+            with self._lock:
+                self._verified.add(key)
+
+        return view
+
+
+_default_store: typing.Optional[BlobStore] = None
+_default_store_loaded = False
+
+
+def default_store() -> typing.Optional[BlobStore]:
+    """The installed store at DEFAULT_STORE_PATH, or None if there is none."""
+    global _default_store, _default_store_loaded
+
+    if not _default_store_loaded:
+        if os.path.exists(DEFAULT_STORE_PATH):
+            try:
+                _default_store = BlobStore(DEFAULT_STORE_PATH)
+            except Exception as e:
+                logging.warning('Ignoring blob store, rebuild it: %s' % e)
+        _default_store_loaded = True
+
+    return _default_store
+
+
+# =============================================================================
+# BUILD STEP
+# =============================================================================
+# Purpose: Import every available blobs_XX module once and write its blobs
+#          into a store file
+#
+# Implementation:
+#   - Devices and modules come from blobs.blob_modules; modules missing from
+#     the installation are skipped
+#   - Every entry records the digest of its source module file
+#   - The file is written under a temporary name and renamed into place
+# =============================================================================
+def build(path: str) -> int:
+    """
+    Compile all blobs_XX modules into a store file.
+
+    Args:
+        path: Output file name
+
+    Returns:
+        Number of blobs written
+    """
+    from importlib import import_module
+    from .blobs import blob_modules, BLOB_NAMES
+
+    blobs: typing.List[typing.Tuple[int, int, str, bytes, bytes]] = []
+    for device, module_name in sorted(blob_modules.items(), key=lambda i: i[0].value):
+        vendor, product = device.value
+        try:
+            module = import_module('.' + module_name, __package__)
+        except ImportError:
+            continue
+
+        source = source_digest(module_name) or NO_SOURCE
+        for name in BLOB_NAMES:
+            if hasattr(module, name):
+                blobs.append((vendor, product, name, bytes(getattr(module, name)), source))
+
+    offset = calcsize(HEADER) + calcsize(ENTRY) * len(blobs)
+    index, data = [], []
+    for vendor, product, name, blob, source in blobs:
+        index.append(pack(ENTRY, vendor, product, name.encode(), offset, len(blob), sha256(blob).digest(), source))
+        data.append(blob)
+        offset += len(blob)
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(pack(HEADER, MAGIC, VERSION, len(blobs)))
+        f.write(b''.join(index))
+        f.write(b''.join(data))
+    os.replace(tmp, path)
+
+    return len(blobs)
+
+
+def main(argv: typing.List[str]):
+    if len(argv) == 3 and argv[1] == 'build':
+        print('Wrote %d blobs to %s' % (build(argv[2]), argv[2]))
+    elif len(argv) in (2, 3) and argv[1] == 'list':
+        store = BlobStore(argv[2] if len(argv) == 3 else DEFAULT_STORE_PATH)
+        for vendor, product, name in sorted(store.keys()):
+            print('%04x:%04x %-28s %6d bytes' % (vendor, product, name, len(store.get(vendor, product, name))))
+    else:
+        print('Usage: python -m validitysensor.blob_store build OUTPUT | list [STORE]', file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -24,21 +24,22 @@
 #   - db_write_enable: Database write enable command
 #
 # Lazy Loading:
-#   - Blobs loaded on-demand (only when needed)
+#   - Blobs loaded on-demand (only when needed), or up front with preload()
 #   - Reduces memory usage (not all blobs loaded at once)
 #   - Enables device-specific blob selection at runtime
 # =============================================================================
 
+import logging
+import threading
+import typing
+from importlib import import_module
+
+from .devices import SupportedDevices
+
 # =============================================================================
-# BLOB LOADER FUNCTION
+# DEVICE BLOB MODULES
 # =============================================================================
-# Purpose: Load device-specific firmware blob based on USB device IDs
-#
-# Implementation:
-#   1. Detects USB device vendor/product IDs
-#   2. Imports appropriate blob module (blobs_90, blobs_92, etc.)
-#   3. Retrieves requested blob from module
-#   4. Caches blob in globals() for subsequent access
+# Purpose: Map supported devices to their blob module
 #
 # Device-Specific Modules:
 #   - blobs_90: Product ID 0090 initialization blobs
@@ -47,47 +48,204 @@
 #   - blobs_9d: Product ID 009d initialization blobs
 #   - blobs_9a: Product ID 009a initialization blobs (Synaptics)
 #
-# Return Value:
-#   - bytes: Binary blob data ready for USB transmission
-#   - Cached in globals() for performance (subsequent calls return cached value)
+# Usage:
+#   - Default contents of the blob registry
+#   - blob_store.build() compiles every module listed here into the binary
+#     blob store
+# =============================================================================
+blob_modules = {
+    SupportedDevices.DEV_90: 'blobs_90',
+    SupportedDevices.DEV_92: 'blobs_92',  # HP EliteBook x360 1030 G2
+    SupportedDevices.DEV_97: 'blobs_97',
+    SupportedDevices.DEV_9d: 'blobs_9d',
+    SupportedDevices.DEV_9a: 'blobs_9a',
+}
+
+# Blob names exported by every blobs_XX module
+BLOB_NAMES = ('init_hardcoded', 'init_hardcoded_clean_slate', 'reset_blob', 'db_write_enable')
+
+
+# =============================================================================
+# BLOB REGISTRY
+# =============================================================================
+# Purpose: Thread-safe, per-device lazy blob lookup
 #
-# Error Handling:
-#   - Raises AttributeError if blob not found in module
-#   - Raises ImportError if device-specific module not available
+# Implementation:
+#   - Device modules are registered by SupportedDevices and imported only
+#     when one of their blobs is first requested
+#   - Blobs come from the compiled blob store if one is installed (see
+#     blob_store.py), otherwise from the device module; get() always returns
+#     bytes (one copy out of the mapping, memoized), view() is the explicit
+#     zero-copy variant for callers that only write the blob out
+#   - The store is only used for a device if it was built from the installed
+#     device module (source digest); a stale store is reported once and the
+#     module is used instead
+#   - Every (device, blob) pair is memoized; the first lookup runs under a
+#     lock, later lookups are a dictionary hit
+#   - Nothing is written to module globals, so several devices can be served
+#     concurrently
+#
+# Preloading:
+#   - preload() resolves blobs ahead of time, so the daemon can warm the
+#     blobs before the first authentication instead of during it
 # =============================================================================
-def __load_blob(blob: str) -> bytes:
+class BlobRegistry:
+    def __init__(self, modules: typing.Optional[typing.Dict[SupportedDevices, str]] = None):
+        self._modules = dict(modules if modules is not None else blob_modules)
+        self._cache: typing.Dict[typing.Tuple[SupportedDevices, str], bytes] = {}
+        self._store_current: typing.Dict[SupportedDevices, bool] = {}
+        self._lock = threading.Lock()
+
+    def register(self, device: SupportedDevices, module_name: str):
+        """Register (or replace) the blob module of a device."""
+        with self._lock:
+            self._modules[device] = module_name
+            self._store_current.pop(device, None)
+            for key in [k for k in self._cache if k[0] == device]:
+                del self._cache[key]
+
+    def get(self, device: SupportedDevices, blob: str) -> bytes:
+        """
+        Look up one blob of a device.
+
+        Args:
+            device: Supported device
+            blob: Blob name (e.g., 'init_hardcoded')
+
+        Returns:
+            bytes
+
+        Raises:
+            KeyError: If no blob module is registered for the device
+            AttributeError: If blob not found in device-specific module
+            ImportError: If device-specific module not available
+        """
+        key = (device, blob)
+        data = self._cache.get(key)
+        if data is None:
+            with self._lock:
+                data = self._cache.get(key)
+                if data is None:
+                    data = self._cache[key] = self._load(device, blob)
+        return data
+
+    def view(self, device: SupportedDevices, blob: str) -> memoryview:
+        """
+        Zero-copy view of one blob.
+
+        The view points into the blob store mapping when a current store is
+        installed. It supports slicing, len(), bytes() and `bytes + view`,
+        but not `view + bytes`; use get() unless the blob is only written out.
+
+        Raises:
+            Same as get()
+        """
+        with self._lock:
+            data = self._from_store(device, blob)
+        return data if data is not None else memoryview(self.get(device, blob))
+
+    def _load(self, device: SupportedDevices, blob: str) -> bytes:
+        data = self._from_store(device, blob)
+        if data is not None:
+            return bytes(data)
+
+        module = import_module('.' + self._modules[device], __package__)
+        return getattr(module, blob)
+
+    def _from_store(self, device: SupportedDevices, blob: str) -> typing.Optional[memoryview]:
+        from .blob_store import default_store
+
+        store = default_store()
+        if store is not None and self._use_store(store, device):
+            return store.get(device.value[0], device.value[1], blob)
+        return None
+
+    def _use_store(self, store, device: SupportedDevices) -> bool:
+        from .blob_store import source_digest
+
+        current = self._store_current.get(device)
+        if current is None:
+            built = store.source(device.value[0], device.value[1])
+            installed = source_digest(self._modules[device])
+            # Without an installed module the store is the only source
+            current = built is None or installed is None or built == installed
+            if not current:
+                logging.warning('Blob store %s is out of date for %s, using %s instead' %
+                                (store.path, device.name, self._modules[device]))
+            self._store_current[device] = current
+        return current
+
+    def preload(self, device: SupportedDevices, names: typing.Iterable[str] = BLOB_NAMES):
+        """
+        Resolve blobs of a device ahead of time.
+
+        Args:
+            device: Supported device
+            names: Blob names to load (blobs missing from the module are skipped)
+        """
+        for name in names:
+            try:
+                self.get(device, name)
+            except AttributeError:
+                pass
+
+
+registry = BlobRegistry()
+
+
+# =============================================================================
+# BLOB LOADER FUNCTION
+# =============================================================================
+# Purpose: Load the blob of the device behind a Usb transport
+#
+# Sessions:
+#   - usb selects the device of a specific session (see session.py), the
+#     default is the usb singleton
+# =============================================================================
+def __load_blob(blob: str, usb=None) -> bytes:
     """
     Load device-specific firmware blob based on USB device IDs.
     
     Args:
         blob: Blob name to load (e.g., 'init_hardcoded', 'reset_blob')
+        usb: Usb transport of the session (defaults to the usb singleton)
         
     Returns:
         bytes: Binary blob data for USB transmission
         
     Raises:
+        KeyError: If the device is not supported
         AttributeError: If blob not found in device-specific module
         ImportError: If device-specific module not available
     """
-    from .usb import usb
-
-    # Detect device and import appropriate blob module
-    if usb.usb_dev().idVendor == 0x138a:  # Validity Sensors vendor ID
-        if usb.usb_dev().idProduct == 0x0090:
-            from . import blobs_90 as blobs
-        elif usb.usb_dev().idProduct == 0x0092:  # HP EliteBook x360 1030 G2
-            from . import blobs_92 as blobs
-        elif usb.usb_dev().idProduct == 0x0097:
-            from . import blobs_97 as blobs
-        elif usb.usb_dev().idProduct == 0x009d:
-            from . import blobs_9d as blobs
-    elif usb.usb_dev().idVendor == 0x06cb:  # Synaptics vendor ID
-        if usb.usb_dev().idProduct == 0x009a:
-            from . import blobs_9a as blobs
-
-    # Cache blob in globals() and return
-    globals()[blob] = getattr(blobs, blob)
-    return globals()[blob]
+    if usb is None:
+        from .usb import usb
+
+    dev = usb.usb_dev()
+    return registry.get(SupportedDevices.from_usbid(dev.idVendor, dev.idProduct), blob)
+
+
+# Public name for callers inside class bodies, where __load_blob is name-mangled
+load_blob = __load_blob
+
+
+def load_blob_view(blob: str, usb=None) -> memoryview:
+    """Zero-copy variant of load_blob() for blobs that are only sent, see BlobRegistry.view()."""
+    if usb is None:
+        from .usb import usb
+
+    dev = usb.usb_dev()
+    return registry.view(SupportedDevices.from_usbid(dev.idVendor, dev.idProduct), blob)
+
+
+def preload(usb=None):
+    """Warm all blobs of the device behind usb (defaults to the usb singleton)."""
+    if usb is None:
+        from .usb import usb
+
+    dev = usb.usb_dev()
+    registry.preload(SupportedDevices.from_usbid(dev.idVendor, dev.idProduct))
+
 
 # =============================================================================
 # BLOB ACCESS FUNCTIONS (Lambda Wrappers)
@@ -97,7 +255,7 @@ def __load_blob(blob: str) -> bytes:
 # Implementation:
 #   - Lambda functions call __load_blob() with specific blob name
 #   - Lazy loading: Blob loaded only when function is called
-#   - Caching: Subsequent calls return cached blob (no re-loading)
+#   - Caching: Subsequent calls return the memoized blob (see BlobRegistry)
 #
 # Available Blobs:
 #   - init_hardcoded: Standard device initialization (firmware present)
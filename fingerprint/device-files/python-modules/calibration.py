@@ -0,0 +1,139 @@
+# =============================================================================
+# CALIBRATION ENGINE - Vectorized Calibration Frames and Subtraction
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Turns the calibration data of a SensorTypeInfo entry into a
+#          frame-shaped NumPy array and subtracts it from captured frames.
+#
+# Operational Context:
+#   Every capture is corrected by the sensor-specific calibration frame before
+#   matching or quality checks. Building that frame from the table entry and
+#   subtracting it line by line in Python dominated per-capture preprocessing;
+#   here the frame is built once per sensor type and the subtraction is a
+#   single in-place array operation.
+#
+# Calibration Frame Layout:
+#   - calibration_blob holds one or more scan lines of bytes_per_line bytes
+#     (or line_width bytes if the blob carries no line headers)
+#   - Each blob line is repeated repeat_multiplier times (the sensor scans
+#     every calibration line repeat_multiplier times in a row)
+#   - The result is repeated cyclically to lines_per_calibration_data lines
+#
+# Subtraction:
+#   - Saturating at zero (pixels darker than the calibration become 0)
+#   - Frames with more lines than the calibration frame get the calibration
+#     frame repeated down the frame, like the sensor repeats it
+#
+# Caching:
+#   - Calibration frames are cached per (sensor type, lines, dtype) and are
+#     read-only; invalidate() drops them, e.g. after recalibration
+# =============================================================================
+
+import threading
+import typing
+
+import numpy as np
+
+from .table_types import SensorTypeInfo
+
+CacheKey = typing.Tuple[int, int, str]
+
+
+class CalibrationEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frames: typing.Dict[CacheKey, np.ndarray] = {}
+
+    @staticmethod
+    def build_frame(info: SensorTypeInfo) -> np.ndarray:
+        """
+        Expand the calibration blob of a sensor type into a calibration frame.
+
+        Args:
+            info: Sensor type information
+
+        Returns:
+            uint8 array of shape (lines_per_calibration_data, width)
+
+        Raises:
+            ValueError: If the blob is not a whole number of scan lines
+        """
+        blob = np.frombuffer(info.calibration_blob, dtype=np.uint8)
+
+        for width in (info.bytes_per_line, info.line_width):
+            if width > 0 and len(blob) > 0 and len(blob) % width == 0:
+                break
+        else:
+            raise ValueError('Calibration blob of sensor type 0x%04x (%d bytes) is not a whole number of lines' %
+                             (info.sensor_type, len(blob)))
+
+        lines = blob.reshape(-1, width)
+        lines = np.repeat(lines, max(info.repeat_multiplier, 1), axis=0)
+        return np.resize(lines, (info.lines_per_calibration_data or len(lines), width))
+
+    def frame(self, info: SensorTypeInfo, lines: typing.Optional[int] = None,
+              dtype: typing.Any = np.uint8) -> np.ndarray:
+        """
+        Cached, read-only calibration frame of a sensor type.
+
+        Args:
+            info: Sensor type information
+            lines: Number of lines (default: lines_per_calibration_data); the
+                   calibration frame is repeated down to this many lines
+            dtype: Element type of the frame to be calibrated
+
+        Returns:
+            Array of shape (lines, width)
+        """
+        dtype = np.dtype(dtype)
+        key = (info.sensor_type, lines or 0, dtype.str)
+
+        frame = self._frames.get(key)
+        if frame is None:
+            frame = self.build_frame(info)
+            if lines is not None and lines != len(frame):
+                frame = np.resize(frame, (lines, frame.shape[1]))
+            frame = frame.astype(dtype, copy=False)
+            frame.flags.writeable = False
+
+            with self._lock:
+                frame = self._frames.setdefault(key, frame)
+
+        return frame
+
+    def apply(self, frame: np.ndarray, info: SensorTypeInfo) -> np.ndarray:
+        """
+        Subtract the calibration frame from a captured frame, in place.
+
+        Args:
+            frame: Writable 2-D array of unsigned integers (lines, width)
+            info: Sensor type information of the sensor that captured it
+
+        Returns:
+            frame (modified in place)
+
+        Raises:
+            ValueError: If the frame width does not match the calibration data
+        """
+        calib = self.frame(info, frame.shape[0], frame.dtype)
+        if calib.shape[1] != frame.shape[1]:
+            raise ValueError('Frame width %d does not match calibration width %d' % (frame.shape[1], calib.shape[1]))
+
+        # Saturating subtraction: raise pixels to at least the calibration
+        # value, then subtract (no negative wrap-around for unsigned types)
+        np.maximum(frame, calib, out=frame)
+        frame -= calib
+        return frame
+
+    def invalidate(self, sensor_type: typing.Optional[int] = None):
+        """Drop the cached frames of one sensor type (or all of them)."""
+        with self._lock:
+            if sensor_type is None:
+                self._frames.clear()
+            else:
+                for key in [k for k in self._frames if k[0] == sensor_type]:
+                    del self._frames[key]
+
+
+# Engine shared by the process
+calibration = CalibrationEngine()
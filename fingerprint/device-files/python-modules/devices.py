@@ -0,0 +1,50 @@
+# =============================================================================
+# SUPPORTED DEVICES - USB IDs of Validity Sensors Fingerprint Devices
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Device enumeration shared by the transport, blob loader and
+#          firmware tables.
+#
+# Operational Context:
+#   Kept free of pyusb and of any other heavy import so that modules which
+#   only need device constants (firmware_tables, blobs) load without pulling
+#   in the USB stack. usb.py re-exports both names.
+# =============================================================================
+
+from enum import Enum
+
+# =============================================================================
+# SUPPORTED DEVICES ENUMERATION
+# =============================================================================
+# Purpose: Define USB vendor/product ID pairs for supported fingerprint sensors
+#
+# Device IDs:
+#   - DEV_90: Validity Sensors 138a:0090 (older model)
+#   - DEV_97: Validity Sensors 138a:0097 (intermediate model)
+#   - DEV_9d: Validity Sensors 138a:009d (intermediate model)
+#   - DEV_92: Validity Sensors 138a:0092 (Synaptics VFS7552 - current system)
+#   - DEV_9a: Synaptics 06cb:009a (alternative vendor)
+#
+# USB ID Format:
+#   - Tuple: (vendor_id, product_id) in hexadecimal
+#   - 0x138a: Validity Sensors vendor ID
+#   - 0x0092: Product ID for VFS7552 sensor
+#
+# Device Matching:
+#   - from_usbid(): Class method to look up device enum from USB IDs
+#   - Used for device identification during discovery
+# =============================================================================
+class SupportedDevices(Enum):
+    """USB IDs for supported devices"""
+    DEV_90 = (0x138a, 0x0090)  # Validity Sensors 138a:0090
+    DEV_97 = (0x138a, 0x0097)  # Validity Sensors 138a:0097
+    DEV_9d = (0x138a, 0x009d)  # Validity Sensors 138a:009d
+    DEV_92 = (0x138a, 0x0092)  # Validity Sensors 138a:0092 (Synaptics VFS7552 - HP EliteBook)
+    DEV_9a = (0x06cb, 0x009a)  # Synaptics 06cb:009a (alternative vendor)
+
+    @classmethod
+    def from_usbid(cls, vendorid, productid):
+        return supported_devices[(vendorid, productid)]
+
+
+supported_devices = dict((dev.value, dev) for dev in SupportedDevices)
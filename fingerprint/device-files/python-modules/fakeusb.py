@@ -0,0 +1,165 @@
+# =============================================================================
+# FAKE USB DEVICE - Record/Replay Backend for Hardware-Free Testing
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Simulates a Validity Sensors device by replaying a captured USB
+#          trace, so the driver stack can run without the physical sensor.
+#
+# Operational Context:
+#   ReplayDevice implements the subset of the pyusb Device interface used by
+#   Usb (write, read, reset, IDs, bus/address, default_timeout). It plugs in
+#   where Usb.open_dev() sets self.dev:
+#
+#     recorder = TraceRecorder(); usb.tracer = recorder   # on real hardware
+#     ... run send_init / init_flash / capture ...
+#     recorder.dump('session.pcap')
+#
+#     usb.open_dev(ReplayDevice.from_trace('session.pcap'))   # on CI
+#     usb.send_init()
+#
+# Replay Rules:
+#   - Every endpoint (1, 129, 130, 131) has its own frame queue
+#   - An IN frame (129/130/131) becomes readable only after all OUT frames
+#     recorded before it have been written, so responses and interrupts keep
+#     their causal position relative to the commands
+#   - A read shorter than the recorded frame returns its head and leaves the
+#     rest queued, like a bulk transfer read in several pieces
+#   - With strict=True every written command must match the recorded one
+#     (TLS traffic uses fresh keys, so strict mode suits only plain flows)
+#
+# Timing:
+#   - latency: simulated device time per transfer, in seconds (a float, or a
+#     dict keyed by endpoint)
+#   - device_time: total simulated device time so far; wall time minus
+#     device_time is the overhead of our own Python layers
+# =============================================================================
+
+import errno
+import threading
+import time
+import typing
+from array import array
+from collections import deque
+
+from usb.core import USBError
+
+from .usb_trace import TraceFrame, load_trace
+
+# libusb error codes reported through USBError.backend_error_code
+LIBUSB_ERROR_NO_DEVICE = -4
+LIBUSB_ERROR_TIMEOUT = -7
+
+
+class ReplayDevice:
+    def __init__(self,
+                 frames: typing.Iterable[TraceFrame],
+                 vendor=0x138a,
+                 product=0x0092,
+                 bus=1,
+                 address=1,
+                 latency: typing.Union[float, typing.Dict[int, float]] = 0.0,
+                 strict=False):
+        """
+        Create a replaying device.
+
+        Args:
+            frames: Recorded frames in capture order (see usb_trace.load_trace)
+            vendor: Reported idVendor
+            product: Reported idProduct
+            bus: Reported bus number
+            address: Reported device address
+            latency: Simulated device time per transfer in seconds
+            strict: Verify written commands against the recording
+        """
+        self.idVendor = vendor
+        self.idProduct = product
+        self.bus = bus
+        self.address = address
+        self.default_timeout = 1000
+        self.latency = latency
+        self.strict = strict
+        self.device_time = 0.0
+
+        self._cond = threading.Condition()
+        self._queues: typing.Dict[int, typing.Deque[typing.Tuple[int, TraceFrame]]] = {}
+        self._writes = 0
+        self._closed = False
+
+        # Tag every frame with the number of OUT frames recorded before it
+        gate = 0
+        for frame in frames:
+            self._queues.setdefault(frame.endpoint, deque()).append((gate, frame))
+            if not frame.endpoint & 0x80:
+                gate += 1
+
+    @classmethod
+    def from_trace(cls, path: str, **kwargs) -> 'ReplayDevice':
+        """Create a replaying device from a pcap file written by TraceRecorder."""
+        return cls(load_trace(path), **kwargs)
+
+    def _delay(self, endpoint: int):
+        if isinstance(self.latency, dict):
+            delay = self.latency.get(endpoint, 0.0)
+        else:
+            delay = self.latency
+
+        if delay > 0:
+            time.sleep(delay)
+            with self._cond:
+                self.device_time += delay
+
+    def write(self, endpoint: int, data, timeout=None):
+        with self._cond:
+            queue = self._queues.get(endpoint)
+            if not queue:
+                raise USBError('Replay trace has no more writes on endpoint %d' % endpoint)
+
+            _, frame = queue.popleft()
+            if self.strict and bytes(data) != frame.payload:
+                raise USBError('Replay mismatch on endpoint %d' % endpoint)
+
+            self._writes += 1
+            self._cond.notify_all()
+
+        self._delay(endpoint)
+        return len(data)
+
+    def read(self, endpoint: int, size_or_buffer, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+
+        deadline = time.monotonic() + timeout / 1000 if timeout else None
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise USBError('No such device', LIBUSB_ERROR_NO_DEVICE, errno.ENODEV)
+
+                queue = self._queues.get(endpoint)
+                if queue and queue[0][0] <= self._writes:
+                    gate, frame = queue.popleft()
+                    size = len(size_or_buffer) if isinstance(size_or_buffer, array) else size_or_buffer
+                    if len(frame.payload) > size:
+                        rest = frame.payload[size:]
+                        queue.appendleft((gate, frame._replace(length=len(rest), payload=rest)))
+                        frame = frame._replace(length=size, payload=frame.payload[:size])
+                    break
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise USBError('Operation timed out', LIBUSB_ERROR_TIMEOUT, errno.ETIMEDOUT)
+
+                self._cond.wait(remaining)
+
+        self._delay(endpoint)
+
+        if isinstance(size_or_buffer, array):
+            size_or_buffer[:len(frame.payload)] = array('B', frame.payload)
+            return len(frame.payload)
+
+        return array('B', frame.payload)
+
+    def reset(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
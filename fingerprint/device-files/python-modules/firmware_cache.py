@@ -0,0 +1,238 @@
+# =============================================================================
+# FIRMWARE HASH CACHE - Streaming SHA-512 Verification with Persistent Results
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Hashes driver packages and firmware files in fixed-size chunks and
+#          remembers the digests on disk, so a file that did not change since
+#          its last verification is not read again.
+#
+# Operational Context:
+#   FIRMWARE_URIS pins the SHA-512 of every driver package, and the firmware
+#   file named in FIRMWARE_NAMES is hashed on every start (its digest also
+#   keys the warm start cache, see Usb.fw_hash). Both files only change when
+#   they are replaced, which the cache detects from their stat data.
+#
+# Cache Key:
+#   - Real path, inode, size and mtime_ns of the file; any change to them
+#     (replacement, rewrite, touch) forces a rehash
+#
+# Audits:
+#   - force=True (CLI: verify --force) always rehashes and refreshes the entry
+#
+# Command Line:
+#   python -m validitysensor.firmware_cache verify [--force] [--device DEV_92 | --sha512 HEX] FILE...
+# =============================================================================
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import typing
+from hashlib import sha512
+
+# Bytes read per hashing step
+CHUNK_SIZE = 64 * 1024
+
+DEFAULT_CACHE_PATH = '/var/cache/python-validity/firmware-hashes.json'
+FIRMWARE_DIR = '/usr/share/python-validity'
+
+
+def sha512_file(path: str, chunk_size: int = CHUNK_SIZE) -> str:
+    """
+    SHA-512 of a file, read in fixed-size chunks into one reused buffer.
+
+    Returns:
+        Hex digest
+    """
+    h = sha512()
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+class FirmwareHashCache:
+    def __init__(self, path: typing.Optional[str] = DEFAULT_CACHE_PATH):
+        """
+        Create a firmware hash cache.
+
+        Args:
+            path: JSON file to persist the cache in (None = in memory only)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+
+        if path is not None:
+            try:
+                with open(path) as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+    @staticmethod
+    def _stat_key(st: os.stat_result) -> typing.Dict[str, int]:
+        return {'inode': st.st_ino, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+    def digest(self, path: str, force=False) -> typing.Tuple[str, bool]:
+        """
+        SHA-512 of a file, from the cache if the file did not change.
+
+        Args:
+            path: File to hash
+            force: Rehash even if the cache has a matching entry
+
+        Returns:
+            (hex digest, True if taken from the cache)
+        """
+        path = os.path.realpath(path)
+        key = self._stat_key(os.stat(path))
+
+        if not force:
+            with self._lock:
+                entry = self._entries.get(path)
+            if entry is not None and all(entry.get(k) == v for k, v in key.items()):
+                return entry['sha512'], True
+
+        digest = sha512_file(path)
+
+        # A file modified while it was hashed must not be cached
+        if self._stat_key(os.stat(path)) == key:
+            with self._lock:
+                self._entries[path] = dict(key, sha512=digest)
+                self._save()
+
+        return digest, False
+
+    def verify(self, path: str, expected: str, force=False) -> bool:
+        """
+        Check a file against a pinned SHA-512.
+
+        Args:
+            path: File to verify
+            expected: Expected hex digest
+            force: Rehash even if the cache has a matching entry
+
+        Returns:
+            True if the digest matches
+        """
+        digest, cached = self.digest(path, force)
+        ok = digest == expected.lower()
+        logging.debug('%s: sha512 %s%s' % (path, 'OK' if ok else 'MISMATCH', ' (cached)' if cached else ''))
+        return ok
+
+    def invalidate(self, path: typing.Optional[str] = None):
+        """Drop one entry (or everything if path is None)."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            elif self._entries.pop(os.path.realpath(path), None) is None:
+                return
+            self._save()
+
+    def _save(self):
+        if self.path is None:
+            return
+
+        tmp = self.path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, 'w') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.warning('Unable to save firmware hash cache %s: %s' % (self.path, e))
+
+
+_default_cache: typing.Optional[FirmwareHashCache] = None
+
+
+def default_cache() -> FirmwareHashCache:
+    """Cache persisted at DEFAULT_CACHE_PATH."""
+    global _default_cache
+
+    if _default_cache is None:
+        _default_cache = FirmwareHashCache()
+
+    return _default_cache
+
+
+def verify_package(path: str, device, force=False, cache: typing.Optional[FirmwareHashCache] = None) -> bool:
+    """
+    Check a driver package against the sha512 pinned in FIRMWARE_URIS.
+
+    Args:
+        path: Driver package (.exe)
+        device: SupportedDevices member
+        force: Rehash even if the cache has a matching entry
+        cache: Hash cache (defaults to the persistent one)
+    """
+    from .firmware_tables import FIRMWARE_URIS
+
+    return (cache or default_cache()).verify(path, FIRMWARE_URIS[device]['sha512'], force)
+
+
+def firmware_hash(device, directory: str = FIRMWARE_DIR, cache: typing.Optional[FirmwareHashCache] = None) -> str:
+    """
+    SHA-512 of the installed firmware file of a device (e.g. for Usb.fw_hash).
+
+    Args:
+        device: SupportedDevices member
+        directory: Directory holding the FIRMWARE_NAMES files
+        cache: Hash cache (defaults to the persistent one)
+    """
+    from .firmware_tables import FIRMWARE_NAMES
+
+    return (cache or default_cache()).digest(os.path.join(directory, FIRMWARE_NAMES[device]))[0]
+
+
+# =============================================================================
+# COMMAND LINE
+# =============================================================================
+def main(argv: typing.List[str]):
+    from .devices import SupportedDevices
+
+    parser = argparse.ArgumentParser(prog='python -m validitysensor.firmware_cache')
+    commands = parser.add_subparsers(dest='command')
+    verify = commands.add_parser('verify', help='hash files and check them against a pinned sha512')
+    verify.add_argument('--force', action='store_true', help='rehash even if the cache has the file (audit)')
+    verify.add_argument('--cache', default=DEFAULT_CACHE_PATH, help='cache file')
+    expected = verify.add_mutually_exclusive_group()
+    expected.add_argument('--device', choices=[d.name for d in SupportedDevices],
+                          help='check against the FIRMWARE_URIS package hash of this device')
+    expected.add_argument('--sha512', help='expected hex digest')
+    verify.add_argument('files', nargs='+')
+    args = parser.parse_args(argv[1:])
+
+    if args.command != 'verify':
+        parser.print_usage(sys.stderr)
+        sys.exit(2)
+
+    cache = FirmwareHashCache(args.cache)
+    pinned = args.sha512
+    if args.device is not None:
+        from .firmware_tables import FIRMWARE_URIS
+        pinned = FIRMWARE_URIS[SupportedDevices[args.device]]['sha512']
+
+    failed = False
+    for path in args.files:
+        digest, cached = cache.digest(path, args.force)
+        status = ''
+        if pinned is not None:
+            ok = digest == pinned.lower()
+            failed = failed or not ok
+            status = ' OK' if ok else ' MISMATCH'
+        print('%s  %s%s%s' % (digest, path, status, ' (cached)' if cached else ''))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
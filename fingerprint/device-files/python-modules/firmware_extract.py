@@ -0,0 +1,233 @@
+# =============================================================================
+# FIRMWARE EXTRACTION - Content-Addressed Cache of Driver Package Payloads
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Unpacks the .xpfwext firmware files from locally supplied driver
+#          packages (FIRMWARE_URIS) once, stores them under the SHA-512 of the
+#          package, and resolves the FIRMWARE_NAMES file of a device from there.
+#
+# Operational Context:
+#   Several devices (DEV_97, DEV_9a, DEV_9d, DEV_92) share one Lenovo package,
+#   which used to be downloaded and unpacked by hand for every machine. With
+#   the cache, fleet imaging extracts each distinct package once and every
+#   device resolves its firmware by the package pin in FIRMWARE_URIS. No
+#   network access is needed; packages are supplied as local files.
+#
+# Cache Layout:
+#   <cache_dir>/<package sha512>/<firmware name>
+#   <cache_dir>/<package sha512>/manifest.json   (firmware name -> sha512)
+#   - Entries are built in a temporary directory and renamed into place, so
+#     an entry that exists is complete
+#
+# Extraction:
+#   - innoextract (streams the Inno Setup archive, nothing is unpacked besides
+#     the requested firmware names)
+#   - HP packages are not Inno Setup installers and fail to extract; DEV_92
+#     is pinned to the Lenovo package for that reason (see firmware_tables)
+#
+# Command Line:
+#   python -m validitysensor.firmware_extract extract PACKAGE...
+#   python -m validitysensor.firmware_extract resolve DEV_92
+#   python -m validitysensor.firmware_extract install DEV_92 [--dest DIR]
+# =============================================================================
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import typing
+
+from .devices import SupportedDevices
+from .firmware_cache import FIRMWARE_DIR, FirmwareHashCache, default_cache, sha512_file
+from .firmware_tables import FIRMWARE_NAMES, FIRMWARE_URIS
+
+DEFAULT_EXTRACT_DIR = '/var/cache/python-validity/firmware'
+
+MANIFEST = 'manifest.json'
+
+
+def pinned_packages() -> typing.Set[str]:
+    """SHA-512 of every driver package listed in FIRMWARE_URIS."""
+    return set(uri['sha512'] for uri in FIRMWARE_URIS.values())
+
+
+class FirmwareExtractor:
+    def __init__(self, cache_dir: str = DEFAULT_EXTRACT_DIR, hashes: typing.Optional[FirmwareHashCache] = None):
+        """
+        Create an extractor over a content-addressed cache directory.
+
+        Args:
+            cache_dir: Root of the extracted firmware cache
+            hashes: Package hash cache (defaults to the persistent one)
+        """
+        self.cache_dir = cache_dir
+        self.hashes = hashes or default_cache()
+
+    def entry_dir(self, package_sha512: str) -> str:
+        return os.path.join(self.cache_dir, package_sha512)
+
+    def extract(self, package: str, allow_unpinned=False) -> str:
+        """
+        Extract the firmware files of a driver package into the cache.
+
+        Args:
+            package: Driver package (.exe)
+            allow_unpinned: Accept packages whose hash is not in FIRMWARE_URIS
+
+        Returns:
+            Package SHA-512 (the cache key)
+
+        Raises:
+            Exception: If the package is not pinned, innoextract fails or the
+                       package contains none of the FIRMWARE_NAMES files
+        """
+        digest, _ = self.hashes.digest(package)
+        if not allow_unpinned and digest not in pinned_packages():
+            raise Exception('%s is not a known driver package (sha512 %s)' % (package, digest))
+
+        entry = self.entry_dir(digest)
+        if os.path.isdir(entry):
+            logging.debug('%s already extracted to %s' % (package, entry))
+            return digest
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix='.extract-', dir=self.cache_dir)
+        try:
+            self._innoextract(package, os.path.join(tmp, 'payload'))
+
+            manifest = {}
+            for root, _, files in os.walk(os.path.join(tmp, 'payload')):
+                for name in files:
+                    if name in manifest:
+                        raise Exception('%s contains %s more than once' % (package, name))
+                    os.rename(os.path.join(root, name), os.path.join(tmp, name))
+                    manifest[name] = sha512_file(os.path.join(tmp, name))
+
+            if not manifest:
+                raise Exception('%s contains no firmware file (%s)' %
+                                (package, ', '.join(sorted(set(FIRMWARE_NAMES.values())))))
+
+            shutil.rmtree(os.path.join(tmp, 'payload'))
+            with open(os.path.join(tmp, MANIFEST), 'w') as f:
+                json.dump(manifest, f, indent=1, sort_keys=True)
+            os.chmod(tmp, 0o755)  # mkdtemp() creates it private
+
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                if not os.path.isdir(entry):
+                    raise
+                # Extracted concurrently by another process, keep theirs
+            else:
+                tmp = None
+        finally:
+            if tmp is not None:
+                shutil.rmtree(tmp, ignore_errors=True)
+
+        logging.info('Extracted %s: %s' % (package, ', '.join(sorted(manifest))))
+        return digest
+
+    @staticmethod
+    def _innoextract(package: str, output_dir: str):
+        cmd = ['innoextract', '--silent', '--output-dir', output_dir]
+        for name in sorted(set(FIRMWARE_NAMES.values())):
+            cmd += ['--include', name]
+        cmd.append(package)
+
+        os.makedirs(output_dir)
+        try:
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except FileNotFoundError:
+            raise Exception('innoextract is required to extract driver packages')
+        except subprocess.CalledProcessError as e:
+            raise Exception('innoextract failed on %s: %s' % (package, e.stderr.decode(errors='replace').strip()))
+
+    def extract_all(self, packages: typing.Iterable[str]) -> typing.Dict[str, str]:
+        """
+        Extract several packages, each distinct package content only once.
+
+        Returns:
+            Package path -> package SHA-512
+        """
+        return dict((package, self.extract(package)) for package in packages)
+
+    def resolve(self, device: SupportedDevices) -> str:
+        """
+        Path of the extracted firmware file of a device.
+
+        Args:
+            device: Supported device
+
+        Returns:
+            Path inside the cache
+
+        Raises:
+            Exception: If the package pinned for the device was not extracted
+        """
+        name = FIRMWARE_NAMES[device]
+        entry = self.entry_dir(FIRMWARE_URIS[device]['sha512'])
+        path = os.path.join(entry, name)
+        if not os.path.exists(path):
+            raise Exception('Firmware %s for %s not extracted yet, run extract on %s' %
+                            (name, device.name, FIRMWARE_URIS[device]['driver'].rsplit('/', 1)[-1]))
+
+        with open(os.path.join(entry, MANIFEST)) as f:
+            expected = json.load(f)[name]
+        if self.hashes.digest(path)[0] != expected:
+            raise Exception('Extracted firmware %s does not match its manifest' % path)
+
+        return path
+
+    def install(self, device: SupportedDevices, dest: str = FIRMWARE_DIR) -> str:
+        """
+        Copy the firmware file of a device to the driver's firmware directory.
+
+        Returns:
+            Installed path
+        """
+        src = self.resolve(device)
+        os.makedirs(dest, exist_ok=True)
+        path = os.path.join(dest, FIRMWARE_NAMES[device])
+        tmp = path + '.tmp'
+        shutil.copyfile(src, tmp)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+        return path
+
+
+# =============================================================================
+# COMMAND LINE
+# =============================================================================
+def main(argv: typing.List[str]):
+    parser = argparse.ArgumentParser(prog='python -m validitysensor.firmware_extract')
+    parser.add_argument('--cache-dir', default=DEFAULT_EXTRACT_DIR)
+    commands = parser.add_subparsers(dest='command')
+    extract = commands.add_parser('extract', help='extract driver packages into the cache')
+    extract.add_argument('--allow-unpinned', action='store_true', help='accept packages not in FIRMWARE_URIS')
+    extract.add_argument('packages', nargs='+')
+    for command in ('resolve', 'install'):
+        sub = commands.add_parser(command, help='%s the firmware file of a device' % command)
+        sub.add_argument('device', choices=[d.name for d in SupportedDevices])
+        if command == 'install':
+            sub.add_argument('--dest', default=FIRMWARE_DIR)
+    args = parser.parse_args(argv[1:])
+
+    extractor = FirmwareExtractor(args.cache_dir)
+    if args.command == 'extract':
+        for package in args.packages:
+            print('%s  %s' % (extractor.extract(package, args.allow_unpinned), package))
+    elif args.command == 'resolve':
+        print(extractor.resolve(SupportedDevices[args.device]))
+    elif args.command == 'install':
+        print(extractor.install(SupportedDevices[args.device], args.dest))
+    else:
+        parser.print_usage(sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -23,7 +23,7 @@
 # =============================================================================
 """Defines various constants for firmware files"""
 
-from .usb import SupportedDevices
+from .devices import SupportedDevices
 
 # =============================================================================
 # FIRMWARE DOWNLOAD URIS
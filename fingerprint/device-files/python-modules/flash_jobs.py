@@ -0,0 +1,155 @@
+# =============================================================================
+# FLASH JOB QUEUE - Pipelined Partition Erase and Write
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Runs a queue of flash erase/write operations against the sensor
+#          while the host prepares the payload of the next operation, and
+#          reports progress and throughput.
+#
+# Operational Context:
+#   init_flash() erases five partitions and then writes the cert partition.
+#   Preparing a job (resolving payloads, splitting them into write chunks) is
+#   host work that does not depend on the device, so it runs on a preparation
+#   thread while the device is busy with the previous job.
+#
+# Pipeline:
+#   - Jobs are prepared in queue order on one background thread, at most
+#     `prefetch` jobs ahead of the one running on the device
+#   - Device operations run in queue order on the calling thread (the TLS
+#     channel is strictly sequential)
+#   - Tls is not thread-safe, so preparation must not use it: payloads that
+#     need the TLS context (tls.make_tls_flash()) are built by the caller
+#     before they are queued
+#   - A failed job stops the queue; jobs not started are dropped
+#
+# Progress:
+#   - The progress callback receives a FlashProgress after every device
+#     operation (one erase, or one write command)
+#   - run() returns the totals; they are also logged
+# =============================================================================
+
+import logging
+import time
+import typing
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# Bytes per flash write command (one flash sector)
+WRITE_CHUNK = 0x1000
+
+FlashProgress = namedtuple('FlashProgress', ['job', 'jobs', 'name', 'done', 'total', 'elapsed', 'throughput'])
+
+# One device operation: (bytes it covers, callable)
+FlashStep = typing.Tuple[int, typing.Callable[[], typing.Any]]
+
+
+class FlashJob:
+    def __init__(self, name: str, prepare: typing.Callable[[], typing.List[FlashStep]]):
+        """
+        Args:
+            name: Description for progress reports ('erase 2', 'write 1')
+            prepare: Host-side preparation, returns the device operations
+        """
+        self.name = name
+        self.prepare = prepare
+
+
+class FlashJobQueue:
+    def __init__(self, progress: typing.Optional[typing.Callable[[FlashProgress], None]] = None, prefetch=1):
+        """
+        Create an empty job queue.
+
+        Args:
+            progress: Called after every device operation
+            prefetch: Number of jobs prepared ahead of the running one
+        """
+        self.progress = progress
+        self.prefetch = max(prefetch, 1)
+        self.jobs: typing.List[FlashJob] = []
+
+    def erase(self, partition: int, size=0):
+        """
+        Queue a partition erase.
+
+        Args:
+            partition: Partition id
+            size: Partition size (only used for throughput reporting)
+        """
+        def prepare():
+            from .flash import erase_flash
+            return [(size, lambda: erase_flash(partition))]
+
+        self.jobs.append(FlashJob('erase %d' % partition, prepare))
+
+    def write(self, partition: int, offset: int, data: typing.Union[bytes, typing.Callable[[], bytes]],
+              chunk_size: typing.Optional[int] = WRITE_CHUNK, skip_blank=False):
+        """
+        Queue a partition write.
+
+        Args:
+            partition: Partition id
+            offset: Offset within the partition
+            data: Data, or a callable producing it (run on the preparation
+                  thread, so it must not use the TLS context)
+            chunk_size: Bytes per write command (None: one command for all data)
+            skip_blank: Skip chunks that are all 0xff (only valid right after
+                        the partition was erased)
+        """
+        def prepare():
+            from .flash import write_flash
+
+            buf = data() if callable(data) else data
+            if chunk_size is None:
+                return [(len(buf), lambda: write_flash(partition, offset, buf))]
+
+            steps = []
+            for pos in range(0, len(buf), chunk_size):
+                chunk = buf[pos:pos + chunk_size]
+                if skip_blank and chunk.count(0xff) == len(chunk):
+                    continue
+                steps.append((len(chunk), lambda pos=pos, chunk=chunk: write_flash(partition, offset + pos, chunk)))
+            return steps
+
+        self.jobs.append(FlashJob('write %d' % partition, prepare))
+
+    def run(self) -> FlashProgress:
+        """
+        Execute all queued jobs in order.
+
+        Returns:
+            Totals of the run (job = number of jobs executed)
+        """
+        jobs, self.jobs = self.jobs, []
+        start = time.perf_counter()
+        done = 0
+        total = 0
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='flash-prep') as prep:
+            pending = [prep.submit(job.prepare) for job in jobs[:self.prefetch]]
+            try:
+                for n, job in enumerate(jobs):
+                    steps = pending.pop(0).result()
+                    if n + self.prefetch < len(jobs):
+                        pending.append(prep.submit(jobs[n + self.prefetch].prepare))
+
+                    job_done = 0
+                    job_total = sum(size for size, _ in steps)
+                    total += job_total
+                    for size, step in steps:
+                        step()
+                        job_done += size
+                        done += size
+                        elapsed = time.perf_counter() - start
+                        if self.progress is not None:
+                            self.progress(FlashProgress(n + 1, len(jobs), job.name, job_done, job_total, elapsed,
+                                                        done / elapsed if elapsed > 0 else 0.0))
+            finally:
+                for future in pending:
+                    future.cancel()
+
+        elapsed = time.perf_counter() - start
+        result = FlashProgress(len(jobs), len(jobs), 'total', done, total, elapsed,
+                               done / elapsed if elapsed > 0 else 0.0)
+        logging.info('Flash jobs: %d jobs, %d bytes in %.2f s (%.1f KiB/s)' %
+                     (len(jobs), done, elapsed, result.throughput / 1024))
+        return result
@@ -0,0 +1,172 @@
+# =============================================================================
+# FLASH LAYOUT PLANNER - Partition Layout from the Detected Flash IC
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Computes the partition table for init_flash() from the size and
+#          sector size reported by get_flash_info() instead of the fixed
+#          flash_layout_hardcoded table.
+#
+# Operational Context:
+#   flash_layout_hardcoded is laid out for a 1 MiB flash with 4 KiB sectors.
+#   On a larger flash IC the template database (partition 4) could use the
+#   extra space, but the hardcoded table leaves it unused.
+#
+# Planning:
+#   - A reserved region at the start of the flash (RESERVED_HEAD, flash
+#     parameters / partition table) and optionally at its end
+#   - Partitions are placed back to back in PARTITION_SPECS order, offsets and
+#     sizes rounded up to the sector size
+#   - Policy 'max_templates': the template database gets all remaining space
+#   - Policy 'fixed': every partition keeps its nominal size, the rest of the
+#     flash stays unallocated
+#   - For a 1 MiB / 0x1000-sector flash both policies reproduce
+#     flash_layout_hardcoded exactly (tests/test_flash_layout.py; on an
+#     installation: python -m validitysensor.flash_layout check)
+#
+# Partition Signature:
+#   - Devices with a non-empty partition signature (get_partition_signature())
+#     only accept the signed, hardcoded table; init_flash() refuses a planned
+#     layout that differs from it on those devices when it formats or
+#     re-provisions the flash (a provisioned flash starts normally)
+# =============================================================================
+
+import sys
+import typing
+from collections import namedtuple
+
+from .flash import PartitionInfo
+
+# Partition to place: size None = template database (sized by the policy)
+PartitionSpec = namedtuple('PartitionSpec', ['id', 'type', 'access_lvl', 'size'])
+
+PARTITION_SPECS = (
+    PartitionSpec(1, 4, 7, 0x00001000),     # cert store (TLS certificates and keys)
+    PartitionSpec(2, 1, 2, 0x00055000),     # xpfwext (firmware image)
+    PartitionSpec(6, 6, 3, 0x00008000),     # calibration data (sensor calibration)
+    PartitionSpec(3, 2, 0x17, 0x0004f000),  # reserved/unknown purpose
+    PartitionSpec(4, 3, 5, None),           # template database (fingerprint templates)
+)
+
+# Nominal template database size (the size of partition 4 on a 1 MiB flash)
+TEMPLATE_DB_SIZE = 0x00052000
+
+# Bytes reserved in front of the first partition
+RESERVED_HEAD = 0x1000
+
+# Sector size assumed if the flash IC reports none
+DEFAULT_SECTOR_SIZE = 0x1000
+
+POLICIES = ('max_templates', 'fixed')
+
+
+def _align(value: int, alignment: int) -> int:
+    return (value + alignment - 1) // alignment * alignment
+
+
+def plan_layout(size: int, sector_size: int, policy='max_templates',
+                reserved_tail=0) -> typing.List[PartitionInfo]:
+    """
+    Plan the partition layout for a flash IC.
+
+    Args:
+        size: Flash size in bytes (FlashInfo.ic.size)
+        sector_size: Sector size in bytes (FlashInfo.ic.secror_size, 0 if unknown)
+        policy: 'max_templates' or 'fixed', see above
+        reserved_tail: Bytes to leave unused at the end of the flash
+
+    Returns:
+        PartitionInfo list in PARTITION_SPECS order
+
+    Raises:
+        Exception: If the partitions do not fit on the flash
+    """
+    if policy not in POLICIES:
+        raise Exception('Unknown layout policy %s' % policy)
+
+    sector = sector_size or DEFAULT_SECTOR_SIZE
+    end = (size - reserved_tail) // sector * sector
+    offset = _align(RESERVED_HEAD, sector)
+
+    layout = []
+    for spec in PARTITION_SPECS:
+        if spec.size is not None:
+            part_size = _align(spec.size, sector)
+        elif policy == 'max_templates':
+            part_size = end - offset
+        else:
+            part_size = _align(TEMPLATE_DB_SIZE, sector)
+
+        if part_size < _align(spec.size or TEMPLATE_DB_SIZE, sector) or offset + part_size > end:
+            raise Exception('Partition %d does not fit on the flash (%d bytes, 0x%x byte sectors)' %
+                            (spec.id, size, sector))
+
+        layout.append(PartitionInfo(spec.id, spec.type, spec.access_lvl, offset, part_size))
+        offset += part_size
+
+    validate_layout(layout, size, sector_size, reserved_tail)
+    return layout
+
+
+def validate_layout(layout: typing.List[PartitionInfo], size: int, sector_size: int, reserved_tail=0):
+    """
+    Check a partition layout against a flash IC.
+
+    Checks: unique ids, sector aligned offsets and sizes, no partition in the
+    reserved regions or beyond the end of the flash, no overlaps.
+
+    Args:
+        layout: Partitions to check
+        size: Flash size in bytes
+        sector_size: Sector size in bytes (0 if unknown)
+        reserved_tail: Bytes that must stay unused at the end of the flash
+
+    Raises:
+        Exception: Describing the first violation found
+    """
+    sector = sector_size or DEFAULT_SECTOR_SIZE
+    end = size - reserved_tail
+
+    ids = [p.id for p in layout]
+    if len(set(ids)) != len(ids):
+        raise Exception('Duplicate partition ids: %s' % ids)
+
+    previous = None
+    for p in sorted(layout, key=lambda p: p.offset):
+        if p.size <= 0 or p.offset % sector or p.size % sector:
+            raise Exception('Partition %d (0x%x+0x%x) is not aligned to 0x%x byte sectors' %
+                            (p.id, p.offset, p.size, sector))
+        if p.offset < RESERVED_HEAD or p.offset + p.size > end:
+            raise Exception('Partition %d (0x%x+0x%x) is outside the usable flash (0x%x-0x%x)' %
+                            (p.id, p.offset, p.size, RESERVED_HEAD, end))
+        if previous is not None and p.offset < previous.offset + previous.size:
+            raise Exception('Partitions %d and %d overlap' % (previous.id, p.id))
+        previous = p
+
+
+# =============================================================================
+# COMMAND LINE
+# =============================================================================
+# plan SIZE [SECTOR] [POLICY]: print the layout for a flash geometry
+# check: verify the planner reproduces flash_layout_hardcoded for 1 MiB flash
+# =============================================================================
+def main(argv: typing.List[str]):
+    if len(argv) == 2 and argv[1] == 'check':
+        from .init_flash import flash_layout_hardcoded
+
+        validate_layout(flash_layout_hardcoded, 0x100000, 0x1000)
+        for policy in POLICIES:
+            if plan_layout(0x100000, 0x1000, policy) != flash_layout_hardcoded:
+                print('FAIL: policy %s does not reproduce flash_layout_hardcoded' % policy)
+                sys.exit(1)
+        print('OK: planned layout matches flash_layout_hardcoded')
+    elif 3 <= len(argv) <= 5 and argv[1] == 'plan':
+        sector_size = int(argv[3], 0) if len(argv) > 3 else 0
+        for p in plan_layout(int(argv[2], 0), sector_size, argv[4] if len(argv) > 4 else 'max_templates'):
+            print('partition %d type %d access 0x%02x offset 0x%08x size 0x%08x' % p)
+    else:
+        print('Usage: python -m validitysensor.flash_layout check | plan SIZE [SECTOR] [POLICY]', file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,186 @@
+# =============================================================================
+# FLASH MANIFEST - Host-Side Record of Provisioned Flash Content
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Remembers what init_flash() last wrote to every partition of a
+#          sensor, so re-provisioning erases and writes only the partitions
+#          whose target content changed.
+#
+# Operational Context:
+#   init_flash() either returned early when the flash was partitioned or
+#   formatted everything. After a TLS cert rotation only the cert partition
+#   (1) changes, yet a full run wipes the 0x55000 byte firmware partition and
+#   the template database. The sensor cannot report partition hashes, so the
+#   comparison is against this host-side manifest.
+#
+# Manifest Entry (per device):
+#   - layout: partition table that was written (id, type, access, offset, size)
+#   - partitions: per partition id, SHA-256 of the content written after the
+#     erase, or null if the partition was left erased
+#   - Content the sensor writes itself (templates in partition 4, calibration
+#     data in 6) is not tracked: an erased-target partition is never erased
+#     again while the manifest says it already was
+#
+# Unknown Devices:
+#   - A sensor without an entry (provisioned before the manifest existed, or
+#     the manifest was lost) has nothing to compare against, so nothing is
+#     reported as changed; only a forced re-provisioning (which records the
+#     result) or a full format brings it under the manifest
+#
+# Device Key:
+#   - USB IDs and the USB serial number of the sensor, so a sensor keeps its
+#     entry on any port and a different sensor on the same port does not
+#     inherit it
+#   - Sensors without a readable serial number have no key: they are never
+#     recorded and always treated as unknown
+# =============================================================================
+
+import json
+import logging
+import os
+import threading
+import typing
+from hashlib import sha256
+
+DEFAULT_MANIFEST_PATH = '/var/lib/python-validity/flash-manifest.json'
+
+# Partition id -> content to write after erasing (None = leave erased)
+FlashTargets = typing.Dict[int, typing.Optional[bytes]]
+
+
+def content_digest(data: typing.Optional[bytes]) -> typing.Optional[str]:
+    return None if data is None else sha256(data).hexdigest()
+
+
+def layout_record(layout) -> typing.List[typing.List[int]]:
+    """Comparable form of a PartitionInfo list (sorted by partition id)."""
+    return sorted([p.id, p.type, p.access_lvl, p.offset, p.size] for p in layout)
+
+
+class FlashManifest:
+    def __init__(self, path: typing.Optional[str] = DEFAULT_MANIFEST_PATH):
+        """
+        Create a flash manifest.
+
+        Args:
+            path: JSON file to persist the manifest in (None = in memory only)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+
+        if path is not None:
+            try:
+                with open(path) as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+    @staticmethod
+    def device_key(dev) -> typing.Optional[str]:
+        """
+        Build the manifest key of a device.
+
+        Args:
+            dev: pyusb Device
+
+        Returns:
+            Key, or None if the device has no readable serial number
+        """
+        try:
+            serial = getattr(dev, 'serial_number', None)
+        except (ValueError, OSError) as e:
+            # No string descriptors or no permission to read them
+            logging.debug('Unable to read USB serial number: %s' % e)
+            serial = None
+
+        if not serial:
+            return None
+
+        return '%04x:%04x#%s' % (dev.idVendor, dev.idProduct, serial)
+
+    def get(self, key: typing.Optional[str]) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        with self._lock:
+            return None if key is None else self._entries.get(key)
+
+    def record(self, key: typing.Optional[str], layout, targets: FlashTargets):
+        """
+        Record the content provisioned on a device.
+
+        Args:
+            key: Device key (None = device without a key, nothing is recorded)
+            layout: PartitionInfo list on the flash
+            targets: Content written per partition (None = erased)
+        """
+        if key is None:
+            return
+
+        with self._lock:
+            entry = self._entries.setdefault(key, {})
+            if entry.get('layout') != layout_record(layout):
+                entry['layout'] = layout_record(layout)
+                entry['partitions'] = {}
+            for pid, data in targets.items():
+                entry['partitions'][str(pid)] = content_digest(data)
+            self._save()
+
+    def invalidate(self, key: typing.Optional[str] = None):
+        """Drop one entry (or everything if key is None)."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            elif self._entries.pop(key, None) is None:
+                return
+            self._save()
+
+    def known(self, key: typing.Optional[str], layout) -> bool:
+        """True if the device has an entry for this layout."""
+        entry = self.get(key)
+        return entry is not None and entry.get('layout') == layout_record(layout)
+
+    def changed(self, key: typing.Optional[str], layout, targets: FlashTargets) -> typing.List[int]:
+        """
+        Partitions whose target content differs from what was provisioned.
+
+        Args:
+            key: Device key
+            layout: PartitionInfo list on the flash
+            targets: Target content per partition (None = erased)
+
+        Returns:
+            Partition ids to erase (and write, if they have content), in the
+            order of targets; none if the device is unknown or was provisioned
+            with another layout (see Unknown Devices above)
+        """
+        if not self.known(key, layout):
+            return []
+
+        provisioned = self.get(key).get('partitions', {})
+        return [pid for pid, data in targets.items()
+                if str(pid) not in provisioned or provisioned[str(pid)] != content_digest(data)]
+
+    def _save(self):
+        if self.path is None:
+            return
+
+        tmp = self.path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, 'w') as f:
+                json.dump(self._entries, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.warning('Unable to save flash manifest %s: %s' % (self.path, e))
+
+
+_default_manifest: typing.Optional[FlashManifest] = None
+
+
+def default_manifest() -> FlashManifest:
+    """Manifest persisted at DEFAULT_MANIFEST_PATH."""
+    global _default_manifest
+
+    if _default_manifest is None:
+        _default_manifest = FlashManifest()
+
+    return _default_manifest
@@ -0,0 +1,129 @@
+# =============================================================================
+# FRAME PIPELINE - Vectorized Decode and Rescale of Captured Frames
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Turns the raw endpoint 130 data of a capture (Usb.read_82() /
+#          iter_82()) into a NumPy image: split into scan lines, strip the
+#          per-line headers, subtract the calibration frame and rescale by
+#          scale_mul/scale_div.
+#
+# Operational Context:
+#   Matching and quality checks work on the image, not on the USB stream.
+#   Slicing the stream line by line and resampling pixels in Python cost
+#   milliseconds per capture; here every step is a strided view or a single
+#   vectorized operation.
+#
+# Line Layout (per SensorTypeInfo):
+#   - Every scan line is bytes_per_line bytes
+#   - The first bytes_per_line - line_width bytes of a line are the line
+#     header, the remaining line_width bytes are pixels
+#   - Trailing bytes that do not form a whole line are ignored
+#
+# Copies:
+#   - decode() only creates views of the caller's buffer (bytes, bytearray,
+#     memoryview or array), no bytes copies
+#   - process() calibrates writable buffers (bytearray, Usb buffer pool) in
+#     place and copies read-only ones (bytes) once; rescale() allocates the
+#     output image
+#
+# Rescaling:
+#   - Nearest-neighbour, integer only: output pixel i takes input pixel
+#     i * scale_div // scale_mul, on both axes
+#   - scale_mul == scale_div returns the input unchanged
+# =============================================================================
+
+import typing
+
+import numpy as np
+
+from .calibration import CalibrationEngine, calibration as default_calibration
+from .table_types import SensorTypeInfo
+
+Buffer = typing.Union[bytes, bytearray, memoryview, np.ndarray]
+
+
+def lines(raw: Buffer, bytes_per_line: int) -> np.ndarray:
+    """
+    View raw capture data as scan lines.
+
+    Args:
+        raw: Raw endpoint 130 data
+        bytes_per_line: Scan line length including the line header
+
+    Returns:
+        uint8 view of shape (lines, bytes_per_line)
+    """
+    data = np.frombuffer(raw, dtype=np.uint8)
+    count = len(data) // bytes_per_line
+    return data[:count * bytes_per_line].reshape(count, bytes_per_line)
+
+
+def decode(raw: Buffer, info: SensorTypeInfo) -> np.ndarray:
+    """
+    View raw capture data as an image (line headers removed).
+
+    Args:
+        raw: Raw endpoint 130 data
+        info: Sensor type information
+
+    Returns:
+        uint8 view of shape (lines, line_width); read-only if raw is
+    """
+    return lines(raw, info.bytes_per_line)[:, info.bytes_per_line - info.line_width:]
+
+
+def rescale(image: np.ndarray, scale_mul: int, scale_div: int) -> np.ndarray:
+    """
+    Nearest-neighbour integer rescale by scale_mul/scale_div on both axes.
+
+    Args:
+        image: 2-D image
+        scale_mul: Scale numerator
+        scale_div: Scale denominator
+
+    Returns:
+        Rescaled image (image itself if the scale is 1)
+    """
+    if scale_mul == scale_div:
+        return image
+
+    height, width = image.shape
+    rows = np.arange(height * scale_mul // scale_div) * scale_div // scale_mul
+    cols = np.arange(width * scale_mul // scale_div) * scale_div // scale_mul
+    # Separable: gather rows, then columns (much cheaper than 2-D fancy indexing)
+    return image.take(rows, axis=0).take(cols, axis=1)
+
+
+def process(raw: Buffer, info: SensorTypeInfo, calibrate=True,
+            engine: typing.Optional[CalibrationEngine] = None) -> np.ndarray:
+    """
+    Full frame pipeline: decode, calibrate, rescale.
+
+    Args:
+        raw: Raw endpoint 130 data
+        info: Sensor type information
+        calibrate: Subtract the calibration frame (see calibration.py)
+        engine: Calibration engine (defaults to the shared one)
+
+    Returns:
+        uint8 image of shape (lines, line_width) scaled by scale_mul/scale_div
+    """
+    if not calibrate:
+        return rescale(decode(raw, info), info.scale_mul, info.scale_div)
+
+    engine = engine or default_calibration
+
+    full = lines(raw, info.bytes_per_line)
+    if not full.flags.writeable:
+        full = full.copy()
+
+    header = info.bytes_per_line - info.line_width
+    image = full[:, header:]
+
+    # Calibration data either covers whole lines (with headers) or pixels only
+    if engine.frame(info).shape[1] == info.bytes_per_line:
+        engine.apply(full, info)
+    else:
+        engine.apply(image, info)
+
+    return rescale(image, info.scale_mul, info.scale_div)
@@ -39,19 +39,20 @@ from binascii import unhexlify
 from hashlib import sha256
 from struct import pack, unpack
 
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.asymmetric import ec
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-
-from .blobs import reset_blob
-from .flash import write_flash, erase_flash, call_cleanups, PartitionInfo, get_flash_info, FlashInfo
-from .hw_tables import FlashIcInfo
+from .blobs import load_blob
+from .flash import call_cleanups, PartitionInfo, get_flash_info, FlashInfo
+from .flash_jobs import FlashJobQueue, FlashProgress
+from .flash_layout import plan_layout
+from .flash_manifest import FlashManifest, default_manifest, layout_record
 from .sensor import reboot, RomInfo
-from .tls import tls, hs_key, crt_hardcoded
-from .usb import usb
+from .session import UsbSession, default_session
+from .tls import hs_key, crt_hardcoded
+from .usb import Usb, usb as default_usb
 from .util import assert_status, unhex
 
+if typing.TYPE_CHECKING:
+    from .hw_tables import FlashIcInfo
+
 # =============================================================================
 # FLASH PARTITION LAYOUT (Product ID 0092 Specific)
 # =============================================================================
@@ -81,6 +82,11 @@ from .util import assert_status, unhex
 #   - This layout is specific to product ID 0092 (HP EliteBook)
 #   - Other device models may have different partition layouts
 #   - Do not use this layout for other devices without verification
+#
+# Planned Layouts:
+#   - flash_layout.plan_layout() derives the same table from the flash IC
+#     geometry (identical for a 1 MiB flash with 4 KiB sectors) and can grow
+#     the template database on larger flash, see target_layout()
 # =============================================================================
 # FIXME!! this table is for 0092, don't merge as-is!
 flash_layout_hardcoded = [
@@ -93,6 +99,9 @@ flash_layout_hardcoded = [
     PartitionInfo(4, 3, 5,    0x000ae000, 0x00052000), # template database (fingerprint templates)
 ]
 
+# Order in which partitions are erased (and then written)
+partition_order = (1, 2, 3, 6, 4)
+
 # =============================================================================
 # PARTITION SIGNATURE
 # =============================================================================
@@ -136,11 +145,22 @@ b46d1791a8758a89e4530529a28084a002c1bf55a81f6b710185c096d16950ae2dc6da0c16dd03b6
 #   - default_backend(): Uses system OpenSSL library
 #   - Provides hardware acceleration if available
 #   - Standard backend for cryptographic operations
+#
+# Lazy Import:
+#   - cryptography is imported by the functions that use it, not at module
+#     import time; the PAM helper imports this package in a fresh interpreter
+#     on every login attempt and never provisions the flash
 # =============================================================================
-crypto_backend = default_backend()
+def crypto_backend():
+    from cryptography.hazmat.backends import default_backend
+
+    return default_backend()
 
 
-def get_partition_signature():
+def get_partition_signature(usb: typing.Optional[Usb] = None):
+    if usb is None:
+        usb = default_usb
+
     if usb.usb_dev().idVendor == 0x138a:
         if usb.usb_dev().idProduct == 0x0090:
             return b''
@@ -148,11 +168,38 @@ def get_partition_signature():
     return partition_signature
 
 
+def target_layout(info: FlashInfo, policy: typing.Optional[str] = None,
+                  usb: typing.Optional[Usb] = None) -> typing.List[PartitionInfo]:
+    """
+    Partition layout to provision.
+
+    Args:
+        info: Flash info (get_flash_info())
+        policy: None for flash_layout_hardcoded, otherwise a flash_layout
+                planner policy ('max_templates', 'fixed')
+        usb: Usb transport of the device (defaults to the usb singleton)
+
+    Raises:
+        Exception: If the device needs the signed hardcoded layout and the
+                   planned one differs from it
+    """
+    if policy is None:
+        return flash_layout_hardcoded
+
+    layout = plan_layout(info.ic.size, info.ic.secror_size, policy)
+    if layout != flash_layout_hardcoded and len(get_partition_signature(usb)) > 0:
+        raise Exception('Partition signature only covers flash_layout_hardcoded, '
+                        'cannot provision a planned layout on this device')
+    return layout
+
+
 def with_hdr(id: int, buf: bytes):
     return pack('<HH', id, len(buf)) + buf
 
 
-def encrypt_key(client_private, client_public):
+def encrypt_key(client_private, client_public, session: typing.Optional[UsbSession] = None):
+    tls = (session or default_session()).tls
+
     x = unhexlify('%064x' % client_public.x)[::-1]
     y = unhexlify('%064x' % client_public.y)[::-1]
     d = unhexlify('%064x' % client_private)[::-1]
@@ -161,8 +208,10 @@ def encrypt_key(client_private, client_public):
     l = 16 - (len(m) % 16)
     m = m + bytes([l]) * l
 
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
     iv = os.urandom(0x10)
-    cipher = Cipher(algorithms.AES(tls.psk_encryption_key), modes.CBC(iv), backend=crypto_backend)
+    cipher = Cipher(algorithms.AES(tls.psk_encryption_key), modes.CBC(iv), backend=crypto_backend())
     encryptor = cipher.encryptor()
     c = iv + encryptor.update(m) + encryptor.finalize()
 
@@ -171,9 +220,12 @@ def encrypt_key(client_private, client_public):
 
 
 def make_cert(client_public):
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec
+
     msg = (pack('<LL', 0x17, 0x20) + unhexlify('%064x' % client_public.x)[::-1] + (b'\0' * 0x24) +
            unhexlify('%064x' % client_public.y)[::-1] + (b'\0' * 0x4c))
-    pk = ec.derive_private_key(hs_key(), ec.SECP256R1(), backend=crypto_backend)
+    pk = ec.derive_private_key(hs_key(), ec.SECP256R1(), backend=crypto_backend())
     s = pk.sign(msg, ec.ECDSA(hashes.SHA256()))
     s = pack('<L', len(s)) + s
     msg = msg + s
@@ -181,7 +233,7 @@ def make_cert(client_public):
     return msg
 
 
-def serialize_flash_params(ic: FlashIcInfo):
+def serialize_flash_params(ic: 'FlashIcInfo'):
     return pack('<LLxxBx', ic.size, ic.secror_size, ic.sector_erase_cmd)
 
 
@@ -191,13 +243,19 @@ def serialize_partition(p: PartitionInfo):
     return b
 
 
-def partition_flash(info: FlashInfo, layout: typing.List[PartitionInfo], client_public):
+def partition_flash(info: FlashInfo,
+                    layout: typing.List[PartitionInfo],
+                    client_public,
+                    session: typing.Optional[UsbSession] = None):
+    session = session or default_session()
+    tls = session.tls
+
     logging.info('Detected Flash IC: %s, %d bytes' % (info.ic.name, info.ic.size))
 
     cmd = unhex('4f 0000 0000')
     cmd += with_hdr(0, serialize_flash_params(info.ic))
     cmd += with_hdr(1,
-                    b''.join([serialize_partition(p) for p in layout]) + get_partition_signature())
+                    b''.join([serialize_partition(p) for p in layout]) + get_partition_signature(session.usb))
     cmd += with_hdr(5, make_cert(client_public))
     cmd += with_hdr(3, crt_hardcoded)
     rsp = tls.cmd(cmd)
@@ -210,23 +268,95 @@ def partition_flash(info: FlashInfo, layout: typing.List[PartitionInfo], client_
     # ^ TODO - figure out what the rest of rsp means
 
 
-def init_flash():
+# =============================================================================
+# FLASH INITIALIZATION ENTRY POINT
+# =============================================================================
+# Device:
+#   - Provisioning always acts on the usb/tls singletons (default_session()):
+#     the flash.py and sensor.py helpers it relies on (get_flash_info,
+#     erase_flash, write_flash, reboot, RomInfo) have no session handle, so
+#     the entry points take none either; SessionManager sessions can open
+#     devices but not provision them
+#
+# Erase/Write:
+#   - Queued on a FlashJobQueue (see flash_jobs.py), progress goes to the
+#     progress callback
+#   - The cert partition image is built on the calling thread before it is
+#     queued (Tls is not thread-safe) and written with a single write command
+#   - What was written is recorded in the flash manifest (flash_manifest.py)
+#
+# Differential Mode:
+#   - On an already partitioned flash, differential=True re-provisions only
+#     the partitions whose target content differs from the manifest (after a
+#     TLS cert rotation: the cert partition); without it init_flash() leaves a
+#     partitioned flash alone
+#   - Nothing is erased on a sensor unknown to the manifest (including
+#     sensors without a USB serial number); force=True erases every partition
+#     (firmware, calibration data and enrolled templates are lost)
+#   - The cert partition image comes from the TLS context, so the TLS session
+#     is opened first if it is not open yet (see open_tls())
+#   - If anything besides the cert partition was erased, the warm start entry
+#     is dropped and the sensor is rebooted, as after a full format
+#
+# Layout:
+#   - layout_policy selects a planned layout instead of flash_layout_hardcoded
+#     (see target_layout()); it only applies when formatting or re-provisioning
+# =============================================================================
+def open_tls(session: UsbSession):
+    """
+    Open the TLS session of a device whose flash is already provisioned.
+
+    Does nothing if the session is open. Otherwise runs the usual start
+    sequence: send_init(), load the keys and certificates from the cert
+    partition, TLS handshake.
+    """
+    from .flash import read_tls_flash
+
+    tls = session.tls
+    if tls.secure_rx and tls.secure_tx:
+        return
+
+    session.usb.send_init()
+    tls.parse_tls_flash(read_tls_flash())
+    tls.open()
+
+
+def init_flash(progress: typing.Optional[typing.Callable[[FlashProgress], None]] = None,
+               differential=False,
+               manifest: typing.Optional[FlashManifest] = None,
+               layout_policy: typing.Optional[str] = None,
+               force=False):
+    session = default_session()
+    usb, tls = session.usb, session.tls
+    manifest = manifest or default_manifest()
+
     info = get_flash_info()
 
+    # The layout is only planned when it is going to be written: a planned
+    # layout is refused on signed devices, which must not block a normal start
     if len(info.partitions) > 0:
         logging.info('Flash has %d partitions.' % len(info.partitions))
+        if differential:
+            reprovision_flash(info, progress, manifest, target_layout(info, layout_policy, usb), force)
         return
     else:
         logging.info('Flash was not initialized yet. Formatting...')
 
-    assert_status(usb.cmd(reset_blob))
+    layout = target_layout(info, layout_policy, usb)
 
-    skey = ec.generate_private_key(ec.SECP256R1(), crypto_backend)
+    # Cached firmware info will no longer be valid after formatting
+    usb.invalidate_warm_start()
+
+    assert_status(usb.cmd(lambda: load_blob('reset_blob', usb)))
+
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    skey = ec.generate_private_key(ec.SECP256R1(), crypto_backend())
     snums = skey.private_numbers()
     client_private = snums.private_value
     client_public = snums.public_numbers
 
-    partition_flash(info, flash_layout_hardcoded, client_public)
+    partition_flash(info, layout, client_public, session)
 
     RomInfo.get()
     # ^ TODO: use the firmware version which to lookup pubkey for server cert validation
@@ -249,19 +379,101 @@ def init_flash():
         raise Exception('Expected zeroes')
 
     tls.handle_ecdh(rsp)
-    tls.handle_priv(encrypt_key(client_private, client_public))
+    tls.handle_priv(encrypt_key(client_private, client_public, session))
     tls.open()
 
+    sizes = dict((p.id, p.size) for p in layout)
+    targets = dict.fromkeys(partition_order)
+    targets[1] = tls.make_tls_flash()
+
+    jobs = FlashJobQueue(progress)
+
     # Wipe newly created partitions clean
-    erase_flash(1)
-    erase_flash(2)
-    erase_flash(3)
-    erase_flash(6)
-    erase_flash(4)
+    for partition in partition_order:
+        jobs.erase(partition, sizes[partition])
 
     # Persist certs and keys on cert partition.
-    write_flash(1, 0, tls.make_tls_flash())
+    jobs.write(1, 0, targets[1], chunk_size=None)
+
+    jobs.run()
+    manifest.record(manifest.device_key(usb.usb_dev()), layout, targets)
 
     # Reboot.
     # The device will disconnect and our service will be started by udev as soon as it is connected again.
     reboot()
+
+
+def reprovision_flash(info: FlashInfo,
+                      progress: typing.Optional[typing.Callable[[FlashProgress], None]] = None,
+                      manifest: typing.Optional[FlashManifest] = None,
+                      layout: typing.Optional[typing.List[PartitionInfo]] = None,
+                      force=False) -> typing.List[int]:
+    """
+    Bring a partitioned flash to the target state, touching only what changed.
+
+    Only sensors known to the flash manifest are touched unless force is set.
+    The cert partition image is built from the current TLS keys and
+    certificates, so the TLS session is opened if needed. If a partition other
+    than the cert partition is erased, the sensor is rebooted afterwards.
+
+    Args:
+        info: Flash info (get_flash_info())
+        progress: Progress callback, see flash_jobs.FlashProgress
+        manifest: Flash manifest (defaults to the persistent one)
+        layout: Target layout (defaults to flash_layout_hardcoded)
+        force: Erase and rewrite every partition regardless of the manifest
+               (loses the firmware, calibration data and enrolled templates)
+
+    Returns:
+        Ids of the partitions that were erased/rewritten
+
+    Raises:
+        Exception: If the flash is partitioned differently from the target
+                   layout (needs a full re-provisioning)
+    """
+    session = default_session()
+    manifest = manifest or default_manifest()
+    layout = layout or flash_layout_hardcoded
+
+    if layout_record(info.partitions) != layout_record(layout):
+        raise Exception('Flash layout differs from the target layout, full re-provisioning required')
+
+    key = manifest.device_key(session.usb.usb_dev())
+    if not force and not manifest.known(key, info.partitions):
+        logging.info('Sensor unknown to the flash manifest, leaving the flash alone (force to re-provision)')
+        return []
+
+    open_tls(session)
+
+    targets = dict.fromkeys(partition_order)
+    targets[1] = session.tls.make_tls_flash()
+
+    changed = list(targets) if force else manifest.changed(key, info.partitions, targets)
+
+    if not changed:
+        logging.info('Flash content is up to date.')
+        return changed
+
+    logging.info('Re-provisioning partitions %s' % ', '.join(str(p) for p in changed))
+
+    # Firmware, calibration or template partition erased: the running
+    # firmware state is gone, cached firmware info is no longer valid
+    needs_reboot = any(targets[partition] is None for partition in changed)
+    if needs_reboot:
+        session.usb.invalidate_warm_start()
+
+    sizes = dict((p.id, p.size) for p in layout)
+    jobs = FlashJobQueue(progress)
+    for partition in changed:
+        jobs.erase(partition, sizes[partition])
+    for partition in changed:
+        if targets[partition] is not None:
+            jobs.write(partition, 0, targets[partition], chunk_size=None)
+
+    jobs.run()
+    manifest.record(key, info.partitions, targets)
+
+    if needs_reboot:
+        reboot()
+
+    return changed
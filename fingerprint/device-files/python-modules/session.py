@@ -0,0 +1,149 @@
+# =============================================================================
+# SESSION MANAGER - Driving Several Fingerprint Sensors from One Process
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Opens several supported sensors at once and gives every device its
+#          own Usb transport, TLS context and worker thread.
+#
+# Operational Context:
+#   usb.py ends with a module-level `usb = Usb()` singleton, and the rest of
+#   the stack historically talked to that one device. A UsbSession bundles
+#   the per-device state instead and is passed as a handle to the functions
+#   that accept it (blobs.__load_blob(), get_partition_signature(),
+#   partition_flash(), encrypt_key()).
+#
+# Per-Session State:
+#   - usb: Usb transport bound to one device
+#   - tls: Tls context created for that transport
+#   - worker: single thread that runs all operations of the session in order
+#
+# Limitations:
+#   - Helpers living outside this directory (flash.py, sensor.py) still use
+#     the global usb/tls singletons; only code paths that take a session
+#     handle are safe to run concurrently on several devices
+#   - SessionManager is for opening and driving sensors, not provisioning
+#     them: init_flash() and reprovision_flash() depend on those helpers and
+#     always act on the singleton device (default_session())
+# =============================================================================
+
+import logging
+import typing
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .usb import Usb, usb as default_usb
+from .usb_discovery import DeviceIndex, device_index
+
+
+class UsbSession:
+    def __init__(self, usb: Usb, tls=None):
+        """
+        Bundle the per-device state of one sensor.
+
+        Args:
+            usb: Opened Usb transport of the device
+            tls: Tls context (a new one bound to usb is created if omitted)
+        """
+        if tls is None:
+            from .tls import Tls
+            tls = Tls(usb)
+
+        self.usb = usb
+        self.tls = tls
+        self._worker: typing.Optional[ThreadPoolExecutor] = None
+
+    @property
+    def path(self) -> typing.Tuple[int, int]:
+        dev = self.usb.usb_dev()
+        return dev.bus, dev.address
+
+    def submit(self, fn: typing.Callable, *args, **kwargs) -> Future:
+        """
+        Run fn(session, *args, **kwargs) on the session worker thread.
+
+        Returns:
+            Future with the result of fn
+        """
+        if self._worker is None:
+            self._worker = ThreadPoolExecutor(max_workers=1,
+                                              thread_name_prefix='usb-%d-%d' % self.path)
+        return self._worker.submit(fn, self, *args, **kwargs)
+
+    def close(self):
+        if self._worker is not None:
+            self._worker.shutdown(wait=True)
+            self._worker = None
+        self.usb.close()
+
+
+_default_session: typing.Optional[UsbSession] = None
+
+
+def default_session() -> UsbSession:
+    """Session wrapping the module-level usb and tls singletons."""
+    global _default_session
+
+    if _default_session is None:
+        from .tls import tls
+        _default_session = UsbSession(default_usb, tls)
+
+    return _default_session
+
+
+class SessionManager:
+    def __init__(self, index: typing.Optional[DeviceIndex] = None):
+        """
+        Create a manager for several concurrently opened sensors.
+
+        Args:
+            index: Device discovery index (defaults to the shared one)
+        """
+        self.index = index if index is not None else device_index
+        self.sessions: typing.Dict[typing.Tuple[int, int], UsbSession] = {}
+
+    def open_all(self, dev_types: typing.Optional[typing.Iterable] = None) -> typing.List[UsbSession]:
+        """
+        Open a session for every connected supported sensor.
+
+        Args:
+            dev_types: SupportedDevices members to open (None = all supported)
+
+        Returns:
+            List of the newly opened sessions
+        """
+        self.index.auto_monitor()
+
+        devs = []
+        if dev_types is None:
+            devs = self.index.find_all()
+        else:
+            for dev_type in dev_types:
+                devs += self.index.find_all(dev_type)
+
+        opened = []
+        for dev in devs:
+            if (dev.bus, dev.address) in self.sessions:
+                continue
+
+            usb = Usb()
+            usb.index = self.index
+            usb.open_dev(dev)
+            session = UsbSession(usb)
+            self.sessions[session.path] = session
+            opened.append(session)
+
+        logging.info('Opened %d sensor session(s)' % len(opened))
+        return opened
+
+    def run_all(self, fn: typing.Callable, *args, **kwargs) -> typing.Dict[typing.Tuple[int, int], Future]:
+        """
+        Run fn(session, *args, **kwargs) on every session in parallel.
+
+        Returns:
+            Futures keyed by device (bus, address)
+        """
+        return dict((path, session.submit(fn, *args, **kwargs)) for path, session in self.sessions.items())
+
+    def close_all(self):
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
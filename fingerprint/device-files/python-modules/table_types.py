@@ -22,8 +22,11 @@
 #   - Firmware compatibility: Version matching logic
 # =============================================================================
 
+import threading
 import typing
 from binascii import hexlify, unhexlify
+from collections import OrderedDict
+from itertools import product
 
 # =============================================================================
 # SENSOR TYPE INFORMATION CLASS
@@ -41,15 +44,48 @@ from binascii import hexlify, unhexlify
 #   - lines_per_calibration_data: Number of lines in calibration data
 #   - line_width: Width of each scan line
 #   - scale_mul/scale_div: Image scaling factors
-#   - calibration_blob: Binary calibration data (hex string converted to bytes)
+#   - calibration_blob: Binary calibration data (hex string converted to bytes
+#     on first access)
 #
 # Usage:
 #   - get_by_type(): Look up sensor configuration by type ID
+#   - get_many(): Look up several sensor types at once
 #   - Used during device initialization to select correct calibration data
+#
+# Lookup Index:
+#   - Dictionary keyed by sensor_type, built on the first lookup after the
+#     generated tables are loaded (first table entry wins, like the old scan)
+#   - Rebuilt when the table is extended or replaced at runtime (detected by
+#     the identity and length of the table list)
 # =============================================================================
 class SensorTypeInfo:
+    # Compact instances: the generated tables hold one entry per known sensor,
+    # of which only one is ever used, so blobs stay hex until first access
+    __slots__ = ('sensor_type', 'bytes_per_line', 'repeat_multiplier', 'lines_per_calibration_data',
+                 'line_width', 'scale_mul', 'scale_div', '_calibration_blob')
+
     table: typing.List["SensorTypeInfo"] = []
 
+    # ((id(table), len(table)), index) of the last built index
+    _index: typing.Tuple[typing.Optional[typing.Tuple[int, int]], typing.Dict[int, "SensorTypeInfo"]] = (None, {})
+    _tables_loaded = False
+
+    @classmethod
+    def _lookup_index(cls) -> typing.Dict[int, "SensorTypeInfo"]:
+        if not cls._tables_loaded:
+            # noinspection PyUnresolvedReferences
+            from . import generated_tables
+            cls._tables_loaded = True
+
+        key, index = cls._index
+        if key != (id(cls.table), len(cls.table)):
+            key, index = (id(cls.table), len(cls.table)), {}
+            for i in cls.table:
+                index.setdefault(i.sensor_type, i)
+            cls._index = (key, index)
+
+        return index
+
     @classmethod
     def get_by_type(cls, sensor_type: int) -> typing.Optional["SensorTypeInfo"]:
         """
@@ -61,11 +97,22 @@ class SensorTypeInfo:
         Returns:
             SensorTypeInfo instance if found, None otherwise
         """
-        # noinspection PyUnresolvedReferences
-        from . import generated_tables
-        for i in cls.table:
-            if i.sensor_type == sensor_type:
-                return i
+        return cls._lookup_index().get(sensor_type)
+
+    @classmethod
+    def get_many(cls, sensor_types: typing.Iterable[int]) -> typing.List[typing.Optional["SensorTypeInfo"]]:
+        """
+        Look up sensor type information for several sensor type IDs.
+
+        Args:
+            sensor_types: Hardware sensor type identifiers
+
+        Returns:
+            List of SensorTypeInfo instances (None where not found), in the
+            order of sensor_types
+        """
+        index = cls._lookup_index()
+        return [index.get(t) for t in sensor_types]
 
     def __init__(self, sensor_type: int, bytes_per_line: int, repeat_multiplier: int,
                  lines_per_calibration_data: int, line_width: int, scale_mul: int, 
@@ -90,7 +137,19 @@ class SensorTypeInfo:
         self.bytes_per_line = bytes_per_line
         self.scale_mul = scale_mul
         self.scale_div = scale_div
-        self.calibration_blob = unhexlify(calibration_blob)  # Convert hex string to binary
+        # Hex string until first access, then the binary data
+        self._calibration_blob: typing.Union[str, bytes] = calibration_blob
+
+    @property
+    def calibration_blob(self) -> bytes:
+        blob = self._calibration_blob
+        if isinstance(blob, str):
+            blob = self._calibration_blob = unhexlify(blob)  # Convert hex string to binary
+        return blob
+
+    @calibration_blob.setter
+    def calibration_blob(self, value: bytes):
+        self._calibration_blob = value
 
     def __repr__(self):
         """String representation for debugging."""
@@ -177,37 +236,107 @@ def metric(i, rominfo):
     return metric
 
 
+# =============================================================================
+# SENSOR CAPTURE PROGRAM CLASS
+# =============================================================================
+# Purpose: Select the capture program for a sensor and firmware version
+#
+# Matching:
+#   - major, dev_type, a0 and a1 must match exactly or be 0xffff (wildcard)
+#   - Among the matching entries the first one with the highest metric() wins
+#
+# Decision Index:
+#   - Entries are bucketed by their (major, dev_type, a0, a1) pattern, so a
+#     lookup only visits the (at most 16) buckets of the exact/wildcard
+#     combinations of the query instead of the whole table
+#   - Rebuilt when the table is extended or replaced at runtime
+#
+# Storage:
+#   - __slots__ instances; blobs are kept as hex text and decoded on first
+#     access, so only the capture programs actually used are ever decoded
+#
+# Result Cache:
+#   - Bounded LRU of joined capture programs keyed by the ROM version
+#     (major, minor, build, u1), sensor type, a0 and a1; repeated captures
+#     return the same bytes object without rescoring or re-joining
+# =============================================================================
 class SensorCaptureProg:
+    __slots__ = ('major', 'minor', 'build', 'u1', 'dev_type', 'a0', 'a1', '_blobs')
+
     table: typing.List["SensorCaptureProg"] = []
 
+    # Maximum number of cached capture programs
+    CACHE_SIZE = 64
+
+    # ((id(table), len(table)), {pattern: [(table position, entry)]})
+    _index: typing.Tuple[typing.Optional[typing.Tuple[int, int]],
+                         typing.Dict[typing.Tuple[int, int, int, int],
+                                     typing.List[typing.Tuple[int, "SensorCaptureProg"]]]] = (None, {})
+    _cache: "OrderedDict[tuple, typing.Optional[bytes]]" = OrderedDict()
+    _lock = threading.Lock()
+    _tables_loaded = False
+
     @classmethod
-    def get(cls, rominfo, sensor_type: int, a0: int, a1: int):
-        # noinspection PyUnresolvedReferences
-        from . import generated_tables
+    def _lookup_index(cls):
+        if not cls._tables_loaded:
+            # noinspection PyUnresolvedReferences
+            from . import generated_tables
+            cls._tables_loaded = True
 
-        maximum = 0
-        found = None
-        for i in SensorCaptureProg.table:
-            if i.major != 0xffff and i.major != rominfo.major:
-                continue
+        key, index = cls._index
+        if key != (id(cls.table), len(cls.table)):
+            key, index = (id(cls.table), len(cls.table)), {}
+            for pos, i in enumerate(cls.table):
+                index.setdefault((i.major, i.dev_type, i.a0, i.a1), []).append((pos, i))
+            with cls._lock:
+                cls._index = (key, index)
+                cls._cache.clear()
+
+        return index
+
+    @classmethod
+    def get(cls, rominfo, sensor_type: int, a0: int, a1: int) -> typing.Optional[bytes]:
+        """
+        Look up the capture program for a sensor.
 
-            if i.dev_type != 0xffff and i.dev_type != sensor_type:
-                continue
+        Args:
+            rominfo: Device ROM information (major, minor, build, u1)
+            sensor_type: Hardware sensor type identifier
+            a0, a1: Capture program selectors
+
+        Returns:
+            Joined capture program, or None if no entry matches
+        """
+        index = cls._lookup_index()
 
-            if i.a0 != 0xffff and i.a0 != a0:
-                continue
+        key = (rominfo.major, rominfo.minor, rominfo.build, rominfo.u1, sensor_type, a0, a1)
+        with cls._lock:
+            if key in cls._cache:
+                cls._cache.move_to_end(key)
+                return cls._cache[key]
 
-            if i.a1 != 0xffff and i.a1 != a1:
-                continue
+        candidates = []
+        for pattern in set(product((rominfo.major, 0xffff), (sensor_type, 0xffff), (a0, 0xffff), (a1, 0xffff))):
+            candidates += index.get(pattern, [])
+        candidates.sort(key=lambda c: c[0])
 
+        maximum = 0
+        found = None
+        for _, i in candidates:
             m = metric(i, rominfo)
 
             if m > maximum:
                 found = i
                 maximum = m
 
-        if found is not None:
-            return b''.join(found.blobs)
+        result = b''.join(found.blobs) if found is not None else None
+
+        with cls._lock:
+            cls._cache[key] = result
+            if len(cls._cache) > cls.CACHE_SIZE:
+                cls._cache.popitem(last=False)
+
+        return result
 
     def __init__(self, major: int, minor: int, build: int, u1: int, dev_type: int, a0: int, a1: int,
                  blobs: typing.Sequence[str]):
@@ -218,7 +347,19 @@ class SensorCaptureProg:
         self.dev_type = dev_type
         self.a0 = a0
         self.a1 = a1
-        self.blobs = [unhexlify(b) for b in blobs]
+        # Tuple of hex strings until first access, then a list of binary blobs
+        self._blobs: typing.Union[typing.Tuple[str, ...], typing.List[bytes]] = tuple(blobs)
+
+    @property
+    def blobs(self) -> typing.List[bytes]:
+        blobs = self._blobs
+        if isinstance(blobs, tuple):
+            blobs = self._blobs = [unhexlify(b) for b in blobs]
+        return blobs
+
+    @blobs.setter
+    def blobs(self, value: typing.List[bytes]):
+        self._blobs = list(value)
 
     def __repr__(self):
         blobs = [hexlify(b).decode() for b in self.blobs]
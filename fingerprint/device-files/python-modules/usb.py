@@ -31,93 +31,278 @@
 
 import errno
 import logging
+import threading
+import time
 import typing
+from array import array
 from binascii import hexlify, unhexlify
-from enum import Enum
+from collections import deque
 from struct import unpack
 
-import usb.core as ucore
-from usb.core import USBError
-
-from .blobs import init_hardcoded, init_hardcoded_clean_slate
+from .devices import SupportedDevices, supported_devices
+from .usb_discovery import DeviceIndex, device_index
+from .usb_metrics import MetricsRegistry
+from .usb_trace import TraceRecorder
 from .util import assert_status
+from .warm_start import WarmStartCache
+
+# pyusb is imported where it is used, so that importing this module (or one
+# of its dependents) for constants does not load the USB stack
+if typing.TYPE_CHECKING:
+    import usb.core as ucore
+
+
+class CancelledException(Exception):
+    pass
+
+
+# Streaming reads on endpoint 130 are rounded up to this size, a multiple of
+# the bulk max packet size for both full speed (64) and high speed (512), so a
+# packet can never overflow the requested length
+BULK_READ_ALIGN = 512
+
+# Seconds between state rechecks of a waiting wait_int() (wakeups normally
+# come from the interrupt reader or cancel())
+INT_RECHECK = 1.0
+
+# Seconds to wait for a device to re-enumerate after a reset
+RESET_SETTLE = 2.0
+
 
 # =============================================================================
-# SUPPORTED DEVICES ENUMERATION
+# RECEIVE BUFFER POOL
 # =============================================================================
-# Purpose: Define USB vendor/product ID pairs for supported fingerprint sensors
-#
-# Device IDs:
-#   - DEV_90: Validity Sensors 138a:0090 (older model)
-#   - DEV_97: Validity Sensors 138a:0097 (intermediate model)
-#   - DEV_9d: Validity Sensors 138a:009d (intermediate model)
-#   - DEV_92: Validity Sensors 138a:0092 (Synaptics VFS7552 - current system)
-#   - DEV_9a: Synaptics 06cb:009a (alternative vendor)
+# Purpose: Reusable receive buffers for the command and image data pipes
 #
-# USB ID Format:
-#   - Tuple: (vendor_id, product_id) in hexadecimal
-#   - 0x138a: Validity Sensors vendor ID
-#   - 0x0092: Product ID for VFS7552 sensor
+# Implementation:
+#   - A fixed ring of preallocated buffers, handed out round-robin
+#   - pyusb reads directly into a caller-supplied array('B') buffer and returns
+#     the transfer length, so no per-transfer allocation or copy is needed
+#   - Responses are returned as memoryview slices of the pool buffer
 #
-# Device Matching:
-#   - from_usbid(): Class method to look up device enum from USB IDs
-#   - Used for device identification during discovery
+# Lifetime:
+#   - A returned memoryview stays valid until the pool wraps around, i.e. for
+#     the next (count - 1) transfers on the same pipe
+#   - Callers that keep a response longer (or need bytes concatenation,
+#     `view + b'..'`) must take a copy with bytes(view)
 # =============================================================================
-class SupportedDevices(Enum):
-    """USB IDs for supported devices"""
-    DEV_90 = (0x138a, 0x0090)  # Validity Sensors 138a:0090
-    DEV_97 = (0x138a, 0x0097)  # Validity Sensors 138a:0097
-    DEV_9d = (0x138a, 0x009d)  # Validity Sensors 138a:009d
-    DEV_92 = (0x138a, 0x0092)  # Validity Sensors 138a:0092 (Synaptics VFS7552 - HP EliteBook)
-    DEV_9a = (0x06cb, 0x009a)  # Synaptics 06cb:009a (alternative vendor)
-
-    @classmethod
-    def from_usbid(cls, vendorid, productid):
-        return supported_devices[(vendorid, productid)]
+class BufferPool:
+    def __init__(self, size: int, count: int):
+        """
+        Preallocate a ring of receive buffers.
 
+        Args:
+            size: Size of every buffer in bytes (maximum transfer length)
+            count: Number of buffers in the ring (must be at least 2)
+        """
+        if count < 2:
+            raise ValueError('Buffer pool needs at least 2 buffers')
 
-supported_devices = dict((dev.value, dev) for dev in SupportedDevices)
+        self.size = size
+        self._buffers = [array('B', bytes(size)) for _ in range(count)]
+        self._next = 0
 
-
-class CancelledException(Exception):
-    pass
+    def get(self) -> array:
+        buf = self._buffers[self._next]
+        self._next = (self._next + 1) % len(self._buffers)
+        return buf
 
 
 class Usb:
     def __init__(self):
         self.trace_enabled = False
-        self.dev: typing.Optional[ucore.Device] = None
-        self.cancel = False
+        # Binary trace recorder, None = disabled (see usb_trace.py)
+        self.tracer: typing.Optional[TraceRecorder] = None
+        # Per-opcode metrics, None = disabled (see usb_metrics.py)
+        self.metrics: typing.Optional[MetricsRegistry] = None
+        self._inflight: typing.Deque[typing.Tuple[str, int, int]] = deque()
+        # Warm start cache for send_init(), None = disabled (see warm_start.py)
+        self.warm_cache: typing.Optional[WarmStartCache] = None
+        # SHA-512 of the installed firmware file, part of the warm start key
+        self.fw_hash = ''
+        # Raw responses of the send_init() queries (fresh or from the cache)
+        self.init_info: typing.Optional[typing.Dict[str, bytes]] = None
+        # Keep-alive mode, see close()
+        self.keep_alive: typing.Optional[float] = None
+        self.parked = False
+        self.warm = False
+        self._park_lock = threading.RLock()
+        self._idle_timer: typing.Optional[threading.Timer] = None
+        self.dev: typing.Optional['ucore.Device'] = None
+        # Device discovery index, shared by default (see usb_discovery.py)
+        self.index: DeviceIndex = device_index
+        # Interrupt endpoint state, shared with the interrupt reader thread
+        self._int_cond = threading.Condition()
+        # Bumped by cancel(): waits started with an older token are cancelled
+        self._cancel_gen = 0
+        self._int_events: typing.Deque[bytes] = deque()
+        self._int_error: typing.Optional[Exception] = None
+        self._int_dev: typing.Optional['ucore.Device'] = None
+        # Receive buffer pools, see use_buffer_pool()
+        self.cmd_buffers: typing.Optional[BufferPool] = None
+        self.data_buffers: typing.Optional[BufferPool] = None
+
+    def use_buffer_pool(self, count=4):
+        """
+        Switch cmd() and read_82() to zero-copy mode.
+
+        Responses are then memoryview slices of preallocated buffers instead of
+        freshly allocated bytes. Slicing, unpack() and assert_status() work on
+        them unchanged; see BufferPool for how long a view stays valid.
+
+        Args:
+            count: Buffers per pipe (0 switches back to bytes responses)
+        """
+        if count == 0:
+            self.cmd_buffers = None
+            self.data_buffers = None
+        else:
+            self.cmd_buffers = BufferPool(100 * 1024, count)
+            self.data_buffers = BufferPool(1024 * 1024, count)
 
     def open(self, vendor=None, product=None):
+        import usb.core as ucore
+
         if vendor is not None and product is not None:
-            dev = ucore.find(idVendor=vendor, idProduct=product)
+            dev_type = supported_devices.get((vendor, product))
+            if dev_type is not None:
+                dev = self.index.find(dev_type)
+            else:
+                dev = ucore.find(idVendor=vendor, idProduct=product)
         else:
-
-            def match(d):
-                return (d.idVendor, d.idProduct) in supported_devices
-
-            dev = ucore.find(custom_match=match)
+            dev = self.index.find()
 
         self.open_dev(dev)
 
     def open_devpath(self, busnum: int, address: int):
-        def match(d):
-            return d.bus == busnum and d.address == address
+        import usb.core as ucore
+
+        dev = self.index.find_path(busnum, address)
 
-        dev = ucore.find(custom_match=match)
+        if dev is None:
+            # Not a supported sensor, open whatever sits at that path
+            def match(d):
+                return d.bus == busnum and d.address == address
+
+            dev = ucore.find(custom_match=match)
 
         self.open_dev(dev)
 
-    def open_dev(self, dev: ucore.Device):
+    def open_dev(self, dev: 'ucore.Device'):
         if dev is None:
             raise Exception('No matching devices found')
 
-        self.dev = dev
-        self.dev.default_timeout = 15000
+        with self._park_lock:
+            if self.parked:
+                self._unpark()
+                same = (dev.bus, dev.address) == (self.dev.bus, self.dev.address)
+                if same and self.health_check():
+                    logging.debug('Reusing kept-alive device')
+                    self.warm = True
+                    return
+
+                self.close(error=True)
+                if same:
+                    # The reset re-enumerated the device, dev is a stale handle
+                    dev = self._find_after_reset(dev)
+
+            self.warm = False
+            self.dev = dev
+            self.dev.default_timeout = 15000
+            self.index.remember(dev)
+
+    # =========================================================================
+    # KEEP-ALIVE MODE
+    # =========================================================================
+    # Purpose: Avoid the reset + re-enumeration + send_init + TLS handshake
+    #          cost for authentication requests that arrive in short succession
+    #
+    # Behaviour (keep_alive set to an idle timeout in seconds):
+    #   - close() parks the device instead of resetting it: the device stays
+    #     claimed and the sensor keeps its session state
+    #   - Reopening the same device within the idle timeout runs a health check
+    #     (RomInfo query); on success the device is reused and `warm` is True,
+    #     so the caller can skip send_init() and the TLS handshake
+    #   - A failed health check, close(error=True) or the idle timeout expiring
+    #     fall back to the normal reset; after a failed health check the
+    #     device is looked up again by port path, since the handle passed to
+    #     open_dev() does not survive the re-enumeration
+    # =========================================================================
+    def health_check(self) -> bool:
+        try:
+            assert_status(self.cmd(unhexlify('01')))
+            return True
+        except Exception as e:
+            logging.info('Kept-alive device failed health check: %s' % e)
+            return False
+
+    def _find_after_reset(self, dev: 'ucore.Device') -> 'ucore.Device':
+        """
+        Look up a device again after it was reset.
+
+        Prefers a device on the same port path (the address changes on
+        re-enumeration) and waits up to RESET_SETTLE seconds for it.
+
+        Raises:
+            Exception: If the device did not come back
+        """
+        dev_type = supported_devices.get((dev.idVendor, dev.idProduct))
+        ports = getattr(dev, 'port_numbers', None)
+        deadline = time.monotonic() + RESET_SETTLE
+        while True:
+            candidates = self.index.find_all(dev_type)
+            for d in candidates:
+                if (d.bus, getattr(d, 'port_numbers', None)) == (dev.bus, ports):
+                    return d
+            if candidates:
+                return candidates[0]
+            if time.monotonic() >= deadline:
+                raise Exception('Device did not come back after reset')
+            time.sleep(0.1)
+
+    def _unpark(self):
+        self.parked = False
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def _idle_expired(self):
+        with self._park_lock:
+            if self.parked:
+                logging.debug('Keep-alive idle timeout, releasing device')
+                self._unpark()
+                self.close(error=True)
+
+    def close(self, error=False):
+        with self._park_lock:
+            if self.keep_alive is not None and not error and self.dev is not None:
+                if not self.parked:
+                    self.cancel()  # a parked device has no waiters
+                    self.parked = True
+                    self._idle_timer = threading.Timer(self.keep_alive, self._idle_expired)
+                    self._idle_timer.daemon = True
+                    self._idle_timer.start()
+                return
+
+            self._unpark()
+            self.warm = False
+            self._reset()
+
+    def _reset(self):
+        with self._int_cond:
+            # Detach the interrupt reader; the reset below aborts its transfer
+            self._int_dev = None
+            self._int_events.clear()
+            self._int_error = None
+            self._cancel_gen += 1  # cancel a pending wait_int()
+            self._int_cond.notify_all()
 
-    def close(self):
         if self.dev is not None:
+            # The reset re-enumerates the device, possibly under a new address,
+            # so its index entry goes now (a lookup before the hotplug add
+            # event rescans). The warm start entry is kept: send_init()
+            # rechecks the firmware info
+            self.index.invalidate(self.dev)
             try:
                 self.dev.reset()
                 self.dev = None
@@ -127,67 +312,382 @@ class Usb:
     def usb_dev(self):
         return self.dev
 
+    def invalidate_warm_start(self):
+        """Forget cached send_init() info of the current device (reset, reflash)."""
+        if self.warm_cache is not None and self.dev is not None:
+            self.warm_cache.invalidate(self.warm_cache.device_key(self.dev, self.fw_hash))
+
+    def firmware_hash(self) -> str:
+        """SHA-512 of the installed firmware file of the device ('' if there is none)."""
+        from .firmware_cache import firmware_hash
+
+        dev_type = supported_devices.get((self.dev.idVendor, self.dev.idProduct))
+        try:
+            return firmware_hash(dev_type)
+        except (KeyError, OSError) as e:
+            logging.debug('No firmware hash for the warm start key: %s' % e)
+            return ''
+
     def send_init(self):
-        # self.dev.set_configuration()
+        from .blobs import load_blob_view
 
-        # TODO analyse responses, detect hardware type
-        assert_status(self.cmd(unhexlify('01')))  # RomInfo.get()
-        assert_status(self.cmd(unhexlify('19')))
+        # self.dev.set_configuration()
 
-        # 43 -- get partition header(?) (02 -- fwext partition)
-        # c28c745a in response is a FwextBuildtime = 0x5A748CC2
-        rsp = self.cmd(unhexlify('4302'))  # get_fw_info()
+        key = None
+        if self.warm_cache is not None:
+            self.fw_hash = self.firmware_hash()
+            key = self.warm_cache.device_key(self.dev, self.fw_hash)
+            entry = self.warm_cache.get(key)
+            # Same device and fwext still loaded (a reset or reflash changes
+            # the firmware info): skip the ROM info and 19 queries
+            if entry is not None and bytes(self.cmd(unhexlify('4302'))) == entry['fw_info']:
+                logging.debug('Warm start, reusing cached ROM and firmware info')
+                self.init_info = entry
+                assert_status(self.cmd(lambda: load_blob_view('init_hardcoded', self)))
+                return
+            if entry is not None:
+                logging.debug('Firmware info changed, dropping warm start entry')
+                self.warm_cache.invalidate(key)
 
-        assert_status(self.cmd(init_hardcoded))
+        # TODO analyse responses, detect hardware type
+        rsps = self.cmd_many(
+            [
+                unhexlify('01'),  # RomInfo.get()
+                unhexlify('19'),
+                # 43 -- get partition header(?) (02 -- fwext partition)
+                # c28c745a in response is a FwextBuildtime = 0x5A748CC2
+                unhexlify('4302'),  # get_fw_info()
+                lambda: load_blob_view('init_hardcoded', self),
+            ],
+            check=[True, True, False, True])
+        rsp = rsps[2]
+        self.init_info = {'rom_info': rsps[0], '19': rsps[1], 'fw_info': rsps[2]}
 
         (err, ), rsp = unpack('<H', rsp[:2]), rsp[2:]
+        if key is not None and err == 0:
+            self.warm_cache.put(key, self.init_info)
+
         if err != 0:
             # fwext is not loaded
             logging.info('Clean slate')
-            self.cmd(init_hardcoded_clean_slate)
+            self.cmd(lambda: load_blob_view('init_hardcoded_clean_slate', self))
 
     def cmd(self, out: typing.Union[bytes, typing.Callable[[], bytes]]):
         if callable(out):
             out = out()
             if not out:
                 return 0
-        self.trace('>cmd> %s' % hexlify(out).decode())
-        self.dev.write(1, out)
-        resp = self.dev.read(129, 100 * 1024)
-        resp = bytes(resp)
-        self.trace('<cmd< %s' % hexlify(resp).decode())
+        self._send_cmd(out)
+        return self._recv_cmd()
+
+    # =========================================================================
+    # BATCH COMMANDS
+    # =========================================================================
+    # Purpose: Send a list of commands with a single call, collecting the
+    #          responses in order and checking their status codes in bulk
+    #
+    # Sequencing:
+    #   - Commands are plain round trips, one after the other: the sensor
+    #     protocol is request/response and the device is not known to queue
+    #     commands, so nothing is written before the previous response is read
+    #   - The first failing status stops the batch (no further commands are
+    #     written) and its assert_status() error is raised
+    #
+    # Responses:
+    #   - Lazy payloads returning nothing are skipped and yield 0, like cmd()
+    #   - Responses are returned as bytes even in buffer pool mode, since a
+    #     batch may outlive the pool ring
+    # =========================================================================
+    def cmd_many(self,
+                 payloads: typing.Sequence[typing.Union[bytes, typing.Callable[[], bytes]]],
+                 check: typing.Union[bool, typing.Sequence[bool]] = True):
+        """
+        Send several commands and collect their responses in order.
+
+        Args:
+            payloads: Command bytes or callables returning them (lazy blobs)
+            check: Run assert_status() on every response, or per-command flags
+
+        Returns:
+            List of responses, one per payload
+
+        Raises:
+            ValueError: If check is a list of a different length than payloads
+            Exception: From assert_status() for the first failing command
+        """
+        checks = [check] * len(payloads) if isinstance(check, bool) else list(check)
+        if len(checks) != len(payloads):
+            raise ValueError('check has %d entries for %d payloads' % (len(checks), len(payloads)))
+        responses: typing.List[typing.Union[bytes, int]] = [0] * len(payloads)
+
+        for i, out in enumerate(payloads):
+            if callable(out):
+                out = out()
+                if not out:
+                    continue
+
+            self._send_cmd(out)
+            responses[i] = bytes(self._recv_cmd())
+            if checks[i]:
+                assert_status(responses[i])
+
+        return responses
+
+    # Command pipe halves. With metrics enabled, _send_cmd() queues the opcode
+    # and start time of each written command and _recv_cmd() completes the
+    # oldest one. A failed write is recorded as an error right away.
+    def _send_cmd(self, out: bytes):
+        if self.tracer is not None:
+            self.tracer.record(1, out)
+        if self.trace_enabled:
+            self.trace('>cmd> %s' % hexlify(out).decode())
+        start = time.perf_counter_ns() if self.metrics is not None else 0
+        try:
+            self.dev.write(1, out)
+        except Exception:
+            if self.metrics is not None:
+                self.metrics.record('%02x' % out[0], len(out), 0, time.perf_counter_ns() - start, error=True)
+            raise
+        # Queued only once written, a failed write has no response to pair with
+        if self.metrics is not None:
+            self._inflight.append(('%02x' % out[0], len(out), start))
+
+    def _recv_cmd(self):
+        try:
+            if self.cmd_buffers is not None:
+                buf = self.cmd_buffers.get()
+                resp = memoryview(buf)[:self.dev.read(129, buf)]
+            else:
+                resp = bytes(self.dev.read(129, 100 * 1024))
+        except Exception:
+            if self.metrics is not None and self._inflight:
+                op, n, start = self._inflight.popleft()
+                self.metrics.record(op, n, 0, time.perf_counter_ns() - start, error=True)
+            raise
+        if self.metrics is not None and self._inflight:
+            op, n, start = self._inflight.popleft()
+            self.metrics.record(op, n, len(resp), time.perf_counter_ns() - start)
+        if self.tracer is not None:
+            self.tracer.record(129, resp)
+        if self.trace_enabled:
+            self.trace('<cmd< %s' % hexlify(resp).decode())
         return resp
 
     def read_82(self):
+        start = time.perf_counter_ns() if self.metrics is not None else 0
         try:
-            resp = self.dev.read(130, 1024 * 1024, timeout=10000)
-            resp = bytes(resp)
-            self.trace('<130< %s' % hexlify(resp).decode())
+            if self.data_buffers is not None:
+                buf = self.data_buffers.get()
+                resp = memoryview(buf)[:self.dev.read(130, buf, timeout=10000)]
+            else:
+                resp = bytes(self.dev.read(130, 1024 * 1024, timeout=10000))
+            if self.metrics is not None:
+                self.metrics.record('ep130', 0, len(resp), time.perf_counter_ns() - start)
+            if self.tracer is not None:
+                self.tracer.record(130, resp)
+            if self.trace_enabled:
+                self.trace('<130< %s' % hexlify(resp).decode())
             return resp
         except Exception as e:
-            self.trace('<130< Error: %s' % repr(e))
+            if self.metrics is not None:
+                self.metrics.record('ep130', 0, 0, time.perf_counter_ns() - start, error=True)
+            if self.trace_enabled:
+                self.trace('<130< Error: %s' % repr(e))
             return None
 
-    # FIXME There is a chance of a race condition here
+    # =========================================================================
+    # STREAMING IMAGE READ (Endpoint 130)
+    # =========================================================================
+    # Purpose: Yield image data line by line while the frame is still being
+    #          transferred, instead of one 1 MiB read at the end
+    #
+    # Implementation:
+    #   - Reads of `lines_per_chunk` lines (rounded up to BULK_READ_ALIGN) are
+    #     issued back to back; whole lines are yielded as soon as they arrive
+    #     and a partial line is carried over to the next read
+    #   - A short read (less than requested) marks the end of the frame, as
+    #     does a timeout once some data has been received; reads after the
+    #     first use the short `next_timeout`, since a frame whose size is a
+    #     multiple of the read size only ends with a timed out read
+    #   - Any bytes after the last whole line are yielded at the end
+    #
+    # Error Handling:
+    #   - Unlike read_82(), transfer errors are raised, so a truncated frame
+    #     cannot be mistaken for a complete one
+    # =========================================================================
+    def iter_82(self, sensor, lines_per_chunk=16, timeout=10000, next_timeout=250) -> typing.Iterator[bytes]:
+        """
+        Stream one image frame from endpoint 130 in line-sized chunks.
+
+        Args:
+            sensor: SensorTypeInfo of the sensor, or its bytes_per_line
+            lines_per_chunk: Number of scan lines requested per USB read
+            timeout: Timeout of the first read in milliseconds
+            next_timeout: Timeout of the following reads in milliseconds (a
+                          timeout there ends the frame)
+
+        Yields:
+            bytes: Whole scan lines (the last chunk may hold a partial line)
+        """
+        from usb.core import USBError
+
+        bytes_per_line = sensor if isinstance(sensor, int) else sensor.bytes_per_line
+        size = bytes_per_line * lines_per_chunk
+        size += -size % BULK_READ_ALIGN
+
+        pending = b''
+        received = 0
+        while True:
+            start = time.perf_counter_ns() if self.metrics is not None else 0
+            try:
+                data = bytes(self.dev.read(130, size, timeout=next_timeout if received else timeout))
+            except USBError as e:
+                if e.errno == errno.ETIMEDOUT and received:
+                    break
+                if self.metrics is not None:
+                    self.metrics.record('ep130', 0, 0, time.perf_counter_ns() - start, error=True)
+                if self.trace_enabled:
+                    self.trace('<130< Error: %s' % repr(e))
+                raise
+
+            if self.metrics is not None:
+                self.metrics.record('ep130', 0, len(data), time.perf_counter_ns() - start)
+            if self.tracer is not None:
+                self.tracer.record(130, data)
+            if self.trace_enabled:
+                self.trace('<130< %s' % hexlify(data).decode())
+
+            received += len(data)
+            pending += data
+            whole = len(pending) - len(pending) % bytes_per_line
+            if whole:
+                yield pending[:whole]
+                pending = pending[whole:]
+
+            if len(data) < size:
+                break
+
+        if pending:
+            yield pending
+
+    def cancel_token(self) -> int:
+        """Token for wait_int(): a later cancel() cancels the wait, even before it started."""
+        with self._int_cond:
+            return self._cancel_gen
+
     def cancel(self):
-        self.cancel = True
+        """Cancel every wait_int() that is pending or holds an earlier token."""
+        with self._int_cond:
+            self._cancel_gen += 1
+            self._int_cond.notify_all()
+
+    def requeue_int(self, resp: bytes):
+        """Put back an interrupt whose waiter gave up, for the next wait_int()."""
+        with self._int_cond:
+            self._int_events.appendleft(resp)
+            self._int_cond.notify_all()
+
+    # =========================================================================
+    # INTERRUPT WAIT (Endpoint 131)
+    # =========================================================================
+    # Purpose: Block until the device raises an interrupt or the wait is
+    #          cancelled, without a fixed polling period
+    #
+    # Implementation:
+    #   - A daemon reader thread keeps one interrupt transfer pending on
+    #     endpoint 131 with no timeout (libusb timeout 0 = unlimited)
+    #   - Received interrupts are queued and the waiter is woken through a
+    #     condition variable; cancel() wakes the same condition
+    #   - The waiter sleeps until one of those events arrives, rechecking its
+    #     state every INT_RECHECK seconds as a safety net (no 100 ms wakeups
+    #     while idle, cancellation takes effect at once)
+    #
+    # Cancellation:
+    #   - cancel() bumps a generation counter instead of setting a flag the
+    #     next wait would reset; a wait cancels when the generation differs
+    #     from its token (cancel_token(), taken when the wait is requested)
+    #   - A caller that hands the wait to another thread takes the token
+    #     first, so a cancel() issued before the thread runs is not lost
+    #   - A cancelled wait leaves queued interrupts in place; requeue_int()
+    #     puts back one that was dequeued for a waiter that has gone away
+    #
+    # Lifetime:
+    #   - The reader is started on the first wait_int() for a device and
+    #     survives cancellation, so an interrupt arriving after a cancelled
+    #     wait is delivered to the next wait_int() (as the device would have
+    #     held it before)
+    #   - close() detaches the reader; the device reset aborts its transfer
+    # =========================================================================
+    def wait_int(self, token: typing.Optional[int] = None):
+        """
+        Wait for the next interrupt.
+
+        Args:
+            token: cancel_token() taken when the wait was requested (default:
+                   now, i.e. only a later cancel() cancels the wait)
+
+        Returns:
+            bytes: Interrupt payload
+
+        Raises:
+            CancelledException: If cancel() was called after the token was taken
+        """
+        start = time.perf_counter_ns() if self.metrics is not None else 0
+        with self._int_cond:
+            if token is None:
+                token = self._cancel_gen
+
+            if self._int_dev is not self.dev:
+                self._int_dev = self.dev
+                self._int_events.clear()
+                self._int_error = None
+                threading.Thread(target=self._int_reader, args=(self.dev, ),
+                                 name='usb-ep131', daemon=True).start()
+
+            while not self._int_events and self._int_error is None and self._cancel_gen == token:
+                self._int_cond.wait(INT_RECHECK)
+
+            if self._cancel_gen != token:
+                raise CancelledException()
+
+            if self._int_events:
+                resp = self._int_events.popleft()
+                if self.metrics is not None:
+                    self.metrics.record('ep131', 0, len(resp), time.perf_counter_ns() - start)
+                return resp
 
-    def wait_int(self):
-        self.cancel = False
+            if self._int_error is not None:
+                if self.metrics is not None:
+                    self.metrics.record('ep131', 0, 0, time.perf_counter_ns() - start, error=True)
+                e, self._int_error = self._int_error, None
+                self._int_dev = None  # the reader has exited, restart on next wait
+                raise e
+
+    def _int_reader(self, dev: 'ucore.Device'):
+        from usb.core import USBError
 
         while True:
             try:
-                resp = self.dev.read(131, 1024, timeout=100)
-                resp = bytes(resp)
-                self.trace('<int< %s' % hexlify(resp).decode())
-                return resp
+                resp = bytes(dev.read(131, 1024, timeout=0))
             except USBError as e:
-                if e.errno == errno.ETIMEDOUT:
-                    if self.cancel:
-                        raise CancelledException()
-                else:
-                    raise e
-
+                with self._int_cond:
+                    if self._int_dev is dev:
+                        self._int_error = e
+                        self._int_cond.notify_all()
+                return
+
+            with self._int_cond:
+                if self._int_dev is not dev:
+                    return
+                if self.tracer is not None:
+                    self.tracer.record(131, resp)
+                if self.trace_enabled:
+                    self.trace('<int< %s' % hexlify(resp).decode())
+                self._int_events.append(resp)
+                self._int_cond.notify_all()
+
+    # Text trace into the debug log. Callers check trace_enabled first so that
+    # the hex formatting is skipped entirely when tracing is off.
     def trace(self, s: str):
         if self.trace_enabled:
             logging.debug(s)
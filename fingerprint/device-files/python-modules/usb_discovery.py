@@ -0,0 +1,254 @@
+# =============================================================================
+# USB DEVICE DISCOVERY - Cached Sensor Index with Hotplug Updates
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Keeps an index of connected Validity Sensors devices so that
+#          Usb.open() and Usb.open_devpath() do not walk the whole USB bus
+#          with a Python predicate on every open.
+#
+# Operational Context:
+#   ucore.find(custom_match=...) enumerates every USB device and calls the
+#   predicate for each of them. The index performs that scan once, keys the
+#   matching devices by SupportedDevices and by (bus, address), and is then
+#   kept current from udev hotplug events, so reopening the sensor after
+#   suspend or a daemon restart is a dictionary lookup.
+#
+# Hotplug Updates:
+#   - start_monitor() listens for udev usb_device add/remove events (needs the
+#     optional pyudev package). The monitor is a thread, so it is opt-in for
+#     long-running processes: SessionManager.open_all() starts it through
+#     auto_monitor(), a daemon may call start_monitor() itself; Usb.open()
+#     never does (short-lived helpers such as the PAM module stay threadless)
+#   - Usb.close() drops the device it reset from the index, and a lookup miss
+#     rescans the bus, so a device that re-enumerated is found before (or
+#     without) its hotplug add event: without a monitor every open after a
+#     close costs a full bus scan, as before the index
+#
+# Persistence:
+#   - With state_path set, the (bus, address, vendor, product) of the last
+#     opened sensor is stored as JSON and preferred when several supported
+#     devices are connected
+#   - This is only a preference hint, the device objects themselves cannot be
+#     persisted: the first lookup of every process (e.g. after a daemon
+#     restart) always scans the bus once
+# =============================================================================
+
+import json
+import logging
+import os
+import threading
+import typing
+
+if typing.TYPE_CHECKING:
+    import usb.core as ucore
+
+DevicePath = typing.Tuple[int, int]
+
+
+class DeviceIndex:
+    def __init__(self, state_path: typing.Optional[str] = None):
+        """
+        Create an (initially empty) device index.
+
+        Args:
+            state_path: JSON file remembering the last opened device (optional)
+        """
+        self.state_path = state_path
+        self._lock = threading.RLock()
+        self._by_path: typing.Dict[DevicePath, 'ucore.Device'] = {}
+        self._by_type: typing.Dict[typing.Any, typing.List['ucore.Device']] = {}
+        self._scanned = False
+        self._observer = None
+        self._monitor_tried = False
+        self._last_path: typing.Optional[DevicePath] = None
+
+        if state_path is not None:
+            self._load_state()
+
+    # =========================================================================
+    # INDEX MAINTENANCE
+    # =========================================================================
+    def scan(self):
+        """Rebuild the index with a single pass over the USB bus."""
+        import usb.core as ucore
+
+        with self._lock:
+            self._by_path.clear()
+            self._by_type.clear()
+            for dev in ucore.find(find_all=True):
+                self.add(dev)
+            self._scanned = True
+
+    def add(self, dev: 'ucore.Device'):
+        """Index a device (ignored unless it is a supported sensor)."""
+        from .devices import supported_devices
+
+        dev_type = supported_devices.get((dev.idVendor, dev.idProduct))
+        if dev_type is None:
+            return
+
+        with self._lock:
+            self.remove(dev.bus, dev.address)
+            self._by_path[(dev.bus, dev.address)] = dev
+            self._by_type.setdefault(dev_type, []).append(dev)
+
+    def remove(self, busnum: int, address: int):
+        """Drop the device at the given path from the index."""
+        with self._lock:
+            dev = self._by_path.pop((busnum, address), None)
+            if dev is not None:
+                for devs in self._by_type.values():
+                    if dev in devs:
+                        devs.remove(dev)
+
+    def invalidate(self, dev: 'ucore.Device'):
+        """Forget a device that is about to re-enumerate (reset)."""
+        self.remove(dev.bus, dev.address)
+
+    # =========================================================================
+    # LOOKUP
+    # =========================================================================
+    def find(self, dev_type=None) -> typing.Optional['ucore.Device']:
+        """
+        Look up a supported sensor.
+
+        Args:
+            dev_type: SupportedDevices member, or None for any supported device
+
+        Returns:
+            pyusb Device, or None if no matching device is connected
+        """
+        return self._lookup(lambda: self._find(dev_type))
+
+    def find_all(self, dev_type=None) -> typing.List['ucore.Device']:
+        """
+        List all connected supported sensors.
+
+        Args:
+            dev_type: SupportedDevices member, or None for any supported device
+
+        Returns:
+            List of pyusb Devices (possibly empty)
+        """
+        with self._lock:
+            if not self._scanned or self._observer is None:
+                self.scan()
+            if dev_type is not None:
+                return list(self._by_type.get(dev_type, []))
+            return list(self._by_path.values())
+
+    def find_path(self, busnum: int, address: int) -> typing.Optional['ucore.Device']:
+        """Look up a supported sensor by its (bus, address) path."""
+        return self._lookup(lambda: self._by_path.get((busnum, address)))
+
+    def _lookup(self, fn: typing.Callable[[], typing.Optional['ucore.Device']]):
+        with self._lock:
+            fresh = not self._scanned
+            if fresh:
+                self.scan()
+
+            dev = fn()
+            if dev is None and not fresh:
+                # A miss may just be a stale index (no monitor, or a device
+                # that re-enumerated before its hotplug add event arrived)
+                self.scan()
+                dev = fn()
+
+            return dev
+
+    def _find(self, dev_type):
+        if dev_type is not None:
+            candidates = self._by_type.get(dev_type, [])
+        else:
+            candidates = list(self._by_path.values())
+
+        for dev in candidates:
+            if (dev.bus, dev.address) == self._last_path:
+                return dev
+
+        return candidates[0] if candidates else None
+
+    # =========================================================================
+    # LAST-KNOWN DEVICE PERSISTENCE
+    # =========================================================================
+    def remember(self, dev: 'ucore.Device'):
+        """Record the device that was opened (persisted if state_path is set)."""
+        self._last_path = (dev.bus, dev.address)
+
+        if self.state_path is None:
+            return
+
+        state = {'bus': dev.bus, 'address': dev.address, 'vendor': dev.idVendor, 'product': dev.idProduct}
+        tmp = self.state_path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp, self.state_path)
+        except OSError as e:
+            logging.warning('Unable to save device state %s: %s' % (self.state_path, e))
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            self._last_path = (state['bus'], state['address'])
+        except (OSError, ValueError, KeyError):
+            pass
+
+    # =========================================================================
+    # HOTPLUG MONITOR (optional pyudev dependency)
+    # =========================================================================
+    def start_monitor(self):
+        """Keep the index current from udev usb_device add/remove events."""
+        try:
+            import pyudev
+        except ImportError:
+            raise Exception('pyudev is required for USB hotplug monitoring')
+
+        import usb.core as ucore
+
+        context = pyudev.Context()
+        monitor = pyudev.Monitor.from_netlink(context)
+        monitor.filter_by('usb', 'usb_device')
+
+        def handle(device):
+            action = device.action
+            try:
+                busnum, address = int(device.properties['BUSNUM']), int(device.properties['DEVNUM'])
+            except (KeyError, ValueError):
+                return
+
+            if action == 'remove':
+                self.remove(busnum, address)
+            elif action == 'add':
+                dev = ucore.find(bus=busnum, address=address)
+                if dev is not None:
+                    self.add(dev)
+
+        with self._lock:
+            if self._observer is None:
+                self.scan()
+                self._observer = pyudev.MonitorObserver(monitor, callback=handle, name='usb-hotplug')
+                self._observer.start()
+
+    def auto_monitor(self):
+        """Start the hotplug monitor once if pyudev is available (no-op otherwise)."""
+        with self._lock:
+            if self._monitor_tried:
+                return
+            self._monitor_tried = True
+
+            try:
+                self.start_monitor()
+            except Exception as e:
+                logging.debug('USB hotplug monitor not started, lookups rescan after close: %s' % e)
+
+    def stop_monitor(self):
+        with self._lock:
+            if self._observer is not None:
+                self._observer.stop()
+                self._observer = None
+
+
+# Index shared by all Usb instances of the process
+device_index = DeviceIndex()
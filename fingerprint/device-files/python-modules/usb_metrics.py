@@ -0,0 +1,198 @@
+# =============================================================================
+# USB METRICS - Per-Opcode Latency and Throughput Instrumentation
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Collects call counts, transferred bytes and latency histograms for
+#          every device command, keyed by command opcode, and exports them
+#          for the Prometheus node_exporter textfile collector.
+#
+# Operational Context:
+#   Usb.metrics is None by default. When a MetricsRegistry is assigned, the
+#   transport records every transfer:
+#     - cmd(): keyed by the first payload byte ('01', '19', '43', '4f', ...);
+#       commands sent through the TLS channel show up under the TLS record
+#       type ('17')
+#     - read_82() / iter_82(): keyed 'ep130' (one entry per USB read)
+#     - wait_int(): keyed 'ep131' (latency = time spent waiting for the event)
+#
+# Latency Histogram:
+#   - HDR-style log-linear buckets over nanoseconds: 16 linear sub-buckets per
+#     power of two, i.e. every recorded value is kept with ~6% precision
+#   - Memory is proportional to the number of distinct buckets hit, not to
+#     the number of samples
+# =============================================================================
+
+import os
+import threading
+import typing
+
+# Linear sub-buckets per power of two (2 ** SUB_BUCKET_BITS)
+SUB_BUCKET_BITS = 4
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts: typing.Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @staticmethod
+    def _index(value: int) -> int:
+        shift = max(value.bit_length() - SUB_BUCKET_BITS - 1, 0)
+        return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+    @staticmethod
+    def _upper(index: int) -> int:
+        """Highest value that falls into the bucket."""
+        shift = max((index >> SUB_BUCKET_BITS) - 1, 0)
+        mantissa = index - (shift << SUB_BUCKET_BITS)
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value: int):
+        i = self._index(value)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.min = value if self.min is None else min(self.min, value)
+
+    def percentile(self, p: float) -> int:
+        """
+        Value below which p percent of the samples fall (bucket precision).
+
+        Args:
+            p: Percentile, 0-100
+        """
+        if self.count == 0:
+            return 0
+
+        rank = max(1, int(round(self.count * p / 100.0)))
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= rank:
+                return min(self._upper(i), self.max)
+
+        return self.max
+
+
+class OpcodeStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.latency = LatencyHistogram()
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats: typing.Dict[str, OpcodeStats] = {}
+
+    def record(self, key: str, bytes_out: int, bytes_in: int, elapsed_ns: int, error=False):
+        """
+        Record one transfer.
+
+        Args:
+            key: Opcode ('01', '4f', ...) or endpoint ('ep130', 'ep131')
+            bytes_out: Bytes sent to the device
+            bytes_in: Bytes received from the device
+            elapsed_ns: Latency in nanoseconds
+            error: The transfer failed
+        """
+        with self._lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = OpcodeStats()
+
+            stats.count += 1
+            stats.bytes_out += bytes_out
+            stats.bytes_in += bytes_in
+            if error:
+                stats.errors += 1
+            else:
+                stats.latency.record(elapsed_ns)
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+    def snapshot(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        """
+        Consistent copy of the current metrics.
+
+        Returns:
+            Dict keyed by opcode with count, errors, bytes_out, bytes_in and
+            latency percentiles (p50/p90/p99/max/mean) in nanoseconds
+        """
+        with self._lock:
+            snap = {}
+            for key, stats in self.stats.items():
+                hist = stats.latency
+                snap[key] = {
+                    'count': stats.count,
+                    'errors': stats.errors,
+                    'bytes_out': stats.bytes_out,
+                    'bytes_in': stats.bytes_in,
+                    'latency_ns': {
+                        'p50': hist.percentile(50),
+                        'p90': hist.percentile(90),
+                        'p99': hist.percentile(99),
+                        'max': hist.max,
+                        'mean': hist.total // hist.count if hist.count else 0,
+                        'sum': hist.total,
+                        'count': hist.count,
+                    }
+                }
+            return snap
+
+    # =========================================================================
+    # PROMETHEUS TEXTFILE EXPORT
+    # =========================================================================
+    # Purpose: Write the metrics in the Prometheus text exposition format for
+    #          node_exporter's textfile collector
+    #
+    # Metrics:
+    #   - validity_usb_transfers_total{opcode}: counter
+    #   - validity_usb_errors_total{opcode}: counter
+    #   - validity_usb_bytes_out_total{opcode}, validity_usb_bytes_in_total{opcode}
+    #   - validity_usb_latency_seconds{opcode,quantile}: summary
+    #
+    # The file is written to a temporary name and renamed, so the collector
+    # never reads a partial file.
+    # =========================================================================
+    def write_prometheus(self, path: str):
+        snap = self.snapshot()
+        lines = []
+
+        def family(name, kind, help_text, values):
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            lines.extend(values)
+
+        def counter(name, field, help_text):
+            family(name, 'counter', help_text,
+                   ['%s{opcode="%s"} %d' % (name, key, s[field]) for key, s in sorted(snap.items())])
+
+        counter('validity_usb_transfers_total', 'count', 'USB transfers by command opcode')
+        counter('validity_usb_errors_total', 'errors', 'Failed USB transfers by command opcode')
+        counter('validity_usb_bytes_out_total', 'bytes_out', 'Bytes sent to the sensor')
+        counter('validity_usb_bytes_in_total', 'bytes_in', 'Bytes received from the sensor')
+
+        values = []
+        for key, s in sorted(snap.items()):
+            lat = s['latency_ns']
+            for q, field in (('0.5', 'p50'), ('0.9', 'p90'), ('0.99', 'p99')):
+                values.append('validity_usb_latency_seconds{opcode="%s",quantile="%s"} %.9f' %
+                              (key, q, lat[field] / 1e9))
+            values.append('validity_usb_latency_seconds_sum{opcode="%s"} %.9f' % (key, lat['sum'] / 1e9))
+            values.append('validity_usb_latency_seconds_count{opcode="%s"} %d' % (key, lat['count']))
+        family('validity_usb_latency_seconds', 'summary', 'USB transfer latency', values)
+
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp, path)
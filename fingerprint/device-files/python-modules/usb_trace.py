@@ -0,0 +1,149 @@
+# =============================================================================
+# USB TRACE RECORDER - Binary Capture of Validity Sensors USB Traffic
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Records raw USB frames exchanged with the fingerprint sensor into a
+#          bounded in-memory ring buffer and dumps them as a pcap file.
+#
+# Operational Context:
+#   The text trace in Usb.trace() hex-encodes every payload into the debug
+#   log, which is slow for 1 MiB image reads and hard to post-process. The
+#   recorder keeps raw payloads instead; the capture can be opened in
+#   Wireshark or replayed by the fake device backend.
+#
+# Cost When Disabled:
+#   - Usb.tracer is None by default; the transport only tests that attribute
+#     before touching a payload, so nothing is copied or formatted
+#
+# File Format:
+#   - Classic pcap with nanosecond timestamps (magic 0xa1b23c4d)
+#   - Link type 189 (LINKTYPE_USB_LINUX): 48-byte usbmon header per frame
+#   - OUT frames are stored as submissions ('S'), IN frames as completions
+#     ('C'), both carrying the payload
+# =============================================================================
+
+import time
+import typing
+from collections import deque, namedtuple
+from struct import pack, unpack, calcsize
+
+PCAP_MAGIC_NS = 0xa1b23c4d
+LINKTYPE_USB_LINUX = 189
+
+# pcap global header, per-record header and Linux usbmon (mon_bin_hdr) header
+PCAP_HEADER = '<IHHiIII'
+PCAP_RECORD = '<IIII'
+USBMON_HEADER = '<QBBBBHbbqiiII8s'
+
+# usbmon transfer types
+XFER_INTERRUPT = 1
+XFER_BULK = 3
+
+# Endpoint 131 (0x83) is the interrupt endpoint, all others are bulk
+INTERRUPT_ENDPOINTS = (131, )
+
+
+# =============================================================================
+# TRACE FRAME
+# =============================================================================
+# Fields:
+#   - timestamp: Wall clock time of the transfer in nanoseconds (time_ns)
+#   - endpoint: Endpoint address (bit 0x80 set for device-to-host)
+#   - length: Original transfer length in bytes
+#   - payload: Captured bytes (may be shorter than length, see snaplen)
+# =============================================================================
+class TraceFrame(namedtuple('TraceFrame', ['timestamp', 'endpoint', 'length', 'payload'])):
+    __slots__ = ()
+
+    @property
+    def direction(self) -> str:
+        return 'in' if self.endpoint & 0x80 else 'out'
+
+
+class TraceRecorder:
+    def __init__(self, capacity=4096, snaplen: typing.Optional[int] = None):
+        """
+        Create a bounded trace ring buffer.
+
+        Args:
+            capacity: Maximum number of frames kept (oldest frames are dropped)
+            snaplen: Maximum payload bytes kept per frame (None = everything)
+        """
+        self.frames: typing.Deque[TraceFrame] = deque(maxlen=capacity)
+        self.snaplen = snaplen
+
+    def record(self, endpoint: int, payload: bytes):
+        """
+        Record one transfer.
+
+        Args:
+            endpoint: Endpoint address (1 = command out, 129/130/131 = in)
+            payload: Transferred bytes (bytes or memoryview, copied here)
+        """
+        captured = payload if self.snaplen is None else payload[:self.snaplen]
+        self.frames.append(TraceFrame(time.time_ns(), endpoint, len(payload), bytes(captured)))
+
+    def clear(self):
+        self.frames.clear()
+
+    def dump(self, path: str, busnum=0, devnum=0):
+        """
+        Write the recorded frames to a pcap file.
+
+        Args:
+            path: Output file name
+            busnum: USB bus number stored in the usbmon headers
+            devnum: USB device address stored in the usbmon headers
+        """
+        frames = list(self.frames)
+        snaplen = max([len(f.payload) for f in frames], default=0) + calcsize(USBMON_HEADER)
+
+        with open(path, 'wb') as f:
+            f.write(pack(PCAP_HEADER, PCAP_MAGIC_NS, 2, 4, 0, 0, snaplen, LINKTYPE_USB_LINUX))
+
+            for i, frame in enumerate(frames):
+                sec, nsec = divmod(frame.timestamp, 1000000000)
+                xfer = XFER_INTERRUPT if frame.endpoint in INTERRUPT_ENDPOINTS else XFER_BULK
+                kind = b'C' if frame.endpoint & 0x80 else b'S'
+                hdr = pack(USBMON_HEADER, i, kind[0], xfer, frame.endpoint, devnum, busnum,
+                           ord('-'), 0, sec, nsec // 1000, 0, frame.length, len(frame.payload),
+                           b'\0' * 8)
+                rec = hdr + frame.payload
+                f.write(pack(PCAP_RECORD, sec, nsec, len(rec), calcsize(USBMON_HEADER) + frame.length))
+                f.write(rec)
+
+
+def load_trace(path: str) -> typing.List[TraceFrame]:
+    """
+    Read frames back from a pcap file written by TraceRecorder.dump().
+
+    Args:
+        path: pcap file name
+
+    Returns:
+        List of TraceFrame in capture order
+
+    Raises:
+        Exception: If the file is not a USB Linux pcap capture
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    magic, _, _, _, _, _, linktype = unpack(PCAP_HEADER, data[:calcsize(PCAP_HEADER)])
+    if magic != PCAP_MAGIC_NS or linktype != LINKTYPE_USB_LINUX:
+        raise Exception('Not a usbmon pcap trace: %s' % path)
+
+    frames = []
+    pos = calcsize(PCAP_HEADER)
+    while pos < len(data):
+        sec, nsec, incl_len, _ = unpack(PCAP_RECORD, data[pos:pos + calcsize(PCAP_RECORD)])
+        pos += calcsize(PCAP_RECORD)
+        rec = data[pos:pos + incl_len]
+        pos += incl_len
+
+        hdr, payload = rec[:calcsize(USBMON_HEADER)], rec[calcsize(USBMON_HEADER):]
+        fields = unpack(USBMON_HEADER, hdr)
+        endpoint, length = fields[3], fields[11]
+        frames.append(TraceFrame(sec * 1000000000 + nsec, endpoint, length, payload))
+
+    return frames
@@ -0,0 +1,112 @@
+# =============================================================================
+# WARM START CACHE - Reuse of Device Info Across Usb.send_init() Calls
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Caches the responses of the `01` (RomInfo), `19` and `4302`
+#          (firmware info) queries issued by Usb.send_init(), so a later
+#          start on the same device with the same firmware loaded can skip
+#          the first two.
+#
+# Operational Context:
+#   Every send_init() used to repeat three query round trips before sending
+#   init_hardcoded. The ROM info and 19 answers only change with the device
+#   or its flash content, so on resume from suspend or a daemon restart they
+#   can be taken from this cache.
+#
+# Cache Key:
+#   - USB IDs, bus, port path and bcdDevice of the device; not the device
+#     address, which changes on every re-enumeration (reset, resume) while
+#     the port path stays the same
+#   - SHA-512 of the installed firmware file (Usb.fw_hash, set by
+#     Usb.send_init() through firmware_cache.firmware_hash())
+#
+# Validation and Invalidation:
+#   - A warm start still queries the firmware info (4302) and compares it
+#     with the cached response; if the device lost its fwext (e.g. through
+#     the reset in Usb.close()) or runs another one, the entry is dropped and
+#     the full query sequence runs
+#   - Usb.close() keeps the entry, so a clean close and reopen (daemon
+#     restart) hits the cache
+#   - init_flash() drops the entry before it reformats the flash
+#   - Entries with a non-zero firmware-info status (clean slate) are never
+#     stored, so the clean-slate path always runs the full query sequence
+#
+# Persistence:
+#   - With a path, the cache is stored as JSON (hex encoded responses) so it
+#     survives daemon restarts
+# =============================================================================
+
+import json
+import logging
+import os
+import threading
+import typing
+from binascii import hexlify, unhexlify
+
+WarmStartEntry = typing.Dict[str, bytes]
+
+
+class WarmStartCache:
+    def __init__(self, path: typing.Optional[str] = None):
+        """
+        Create a warm start cache.
+
+        Args:
+            path: JSON file to persist the cache in (optional)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: typing.Dict[str, typing.Dict[str, str]] = {}
+
+        if path is not None:
+            try:
+                with open(path) as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+    @staticmethod
+    def device_key(dev, fw_hash='') -> str:
+        """
+        Build the cache key of a device.
+
+        Args:
+            dev: pyusb Device
+            fw_hash: Hash of the firmware file in use
+        """
+        ports = '.'.join(str(p) for p in (getattr(dev, 'port_numbers', None) or ()))
+        return '%04x:%04x@%d-%s:%04x#%s' % (dev.idVendor, dev.idProduct, dev.bus, ports,
+                                            getattr(dev, 'bcdDevice', 0), fw_hash)
+
+    def get(self, key: str) -> typing.Optional[WarmStartEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            return dict((name, unhexlify(value)) for name, value in entry.items())
+
+    def put(self, key: str, entry: WarmStartEntry):
+        with self._lock:
+            self._entries[key] = dict((name, hexlify(value).decode()) for name, value in entry.items())
+            self._save()
+
+    def invalidate(self, key: typing.Optional[str] = None):
+        """Drop one entry (or everything if key is None)."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            elif self._entries.pop(key, None) is None:
+                return
+            self._save()
+
+    def _save(self):
+        if self.path is None:
+            return
+
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.warning('Unable to save warm start cache %s: %s' % (self.path, e))
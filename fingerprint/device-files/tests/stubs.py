@@ -0,0 +1,69 @@
+# =============================================================================
+# TEST SUPPORT - Import python-modules as the validitysensor Package
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Makes the python-modules directory importable as validitysensor for
+#          the tests, with stand-ins for the modules this tree does not ship.
+#
+# Operational Context:
+#   flash.py, sensor.py and tls.py come from the python-validity package and
+#   are not part of this tree. Tests only need the few names that the modules
+#   under test import from them; those are provided here, and flash records
+#   the erase/write calls it receives in flash.calls. hw_tables.py is not
+#   stubbed: it is only imported for type checking.
+#
+# Third-Party Dependencies:
+#   - pyusb and numpy are not stubbed; require() skips a test module when one
+#     of them is not installed
+# =============================================================================
+
+import importlib
+import os
+import sys
+import types
+import unittest
+from collections import namedtuple
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python-modules')
+
+
+def require(*modules: str):
+    """Skip the calling test module unless all modules can be imported."""
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            raise unittest.SkipTest('%s is not installed' % name)
+
+
+def load_package():
+    """Import python-modules as validitysensor with the out-of-tree modules stubbed."""
+    if 'validitysensor' in sys.modules:
+        return
+
+    package = types.ModuleType('validitysensor')
+    package.__path__ = [os.path.abspath(SOURCE_DIR)]
+    sys.modules['validitysensor'] = package
+
+    flash = types.ModuleType('validitysensor.flash')
+    flash.PartitionInfo = namedtuple('PartitionInfo', ['id', 'type', 'access_lvl', 'offset', 'size'])
+    flash.FlashInfo = namedtuple('FlashInfo', ['ic', 'blocks', 'unknown0', 'blocksize', 'unknown1', 'partitions'])
+    flash.calls = []
+    flash.get_flash_info = None
+    flash.erase_flash = lambda partition: flash.calls.append(('erase', partition))
+    flash.write_flash = lambda partition, addr, data: flash.calls.append(('write', partition, addr, bytes(data)))
+    flash.call_cleanups = lambda: None
+    flash.read_tls_flash = lambda: b'tls flash'
+
+    sensor = types.ModuleType('validitysensor.sensor')
+    sensor.reboot = lambda: None
+    sensor.RomInfo = None
+
+    tls = types.ModuleType('validitysensor.tls')
+    tls.hs_key = None
+    tls.crt_hardcoded = b''
+    tls.tls = None
+
+    for module in (flash, sensor, tls):
+        sys.modules[module.__name__] = module
+
@@ -0,0 +1,76 @@
+# =============================================================================
+# ASYNC USB TESTS - Interrupt Wait Cancellation
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Checks that cancelling an AsyncUsb.wait_int() task neither wedges
+#          the interrupt pipe nor loses an interrupt, including when the task
+#          is cancelled before its worker has started the wait.
+#
+# Operational Context:
+#   The device is a fakeusb.ReplayDevice built from in-memory trace frames;
+#   pyusb must be installed (ReplayDevice raises its USBError).
+# =============================================================================
+
+import asyncio
+import threading
+import unittest
+
+from stubs import load_package, require
+
+require('usb.core')
+load_package()
+
+from validitysensor.async_usb import AsyncUsb  # noqa: E402
+from validitysensor.fakeusb import ReplayDevice  # noqa: E402
+from validitysensor.usb import CancelledException, Usb  # noqa: E402
+from validitysensor.usb_trace import TraceFrame  # noqa: E402
+
+INTERRUPT = b'\x01\x02'
+
+
+class WaitIntCancelTest(unittest.TestCase):
+    def setUp(self):
+        self.usb = Usb()
+        self.usb.open_dev(ReplayDevice([TraceFrame(0, 131, len(INTERRUPT), INTERRUPT)]))
+
+    def tearDown(self):
+        self.usb.close(error=True)
+
+    def test_cancel_before_worker_starts(self):
+        ausb = AsyncUsb(self.usb)
+
+        async def run():
+            # Occupy the interrupt worker so the wait below stays queued
+            gate = threading.Event()
+            blocker = asyncio.get_running_loop().run_in_executor(ausb._int_pool, gate.wait)
+
+            task = asyncio.ensure_future(ausb.wait_int())
+            await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+            gate.set()
+            await blocker
+            return await asyncio.wait_for(ausb.wait_int(), 2)
+
+        try:
+            self.assertEqual(asyncio.run(run()), INTERRUPT)
+        finally:
+            ausb.close()
+
+    def test_token_taken_before_cancel(self):
+        token = self.usb.cancel_token()
+        self.usb.cancel()
+        with self.assertRaises(CancelledException):
+            self.usb.wait_int(token)
+        self.assertEqual(self.usb.wait_int(), INTERRUPT)
+
+    def test_requeued_interrupt_comes_first(self):
+        self.assertEqual(self.usb.wait_int(), INTERRUPT)
+        self.usb.requeue_int(b'\x03')
+        self.assertEqual(self.usb.wait_int(), b'\x03')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# =============================================================================
+# BLOB STORE TESTS - Compiled Store Against the blobs_92 Module
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Builds a blob store from the blobs_XX modules of this tree and
+#          checks that the blob loader serves the same blobs from it, as bytes
+#          unless the zero-copy view is asked for explicitly.
+# =============================================================================
+
+import os
+import tempfile
+import unittest
+
+from stubs import load_package
+
+load_package()
+
+from validitysensor import blob_store, blobs_92  # noqa: E402
+from validitysensor.blobs import BlobRegistry  # noqa: E402
+from validitysensor.devices import SupportedDevices  # noqa: E402
+
+
+class BlobStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'blobs.bin')
+        self.assertGreater(blob_store.build(self.path), 0)
+
+        self.saved = blob_store.DEFAULT_STORE_PATH, blob_store._default_store, blob_store._default_store_loaded
+        blob_store.DEFAULT_STORE_PATH = self.path
+        blob_store._default_store, blob_store._default_store_loaded = None, False
+
+    def tearDown(self):
+        store = blob_store._default_store
+        blob_store.DEFAULT_STORE_PATH, blob_store._default_store, blob_store._default_store_loaded = self.saved
+        if store is not None:
+            store._map.close()
+        self.tmp.cleanup()
+
+    def test_store_blob_concatenates(self):
+        registry = BlobRegistry()
+        blob = registry.get(SupportedDevices.DEV_92, 'init_hardcoded')
+        self.assertIsNotNone(blob_store.default_store())
+        self.assertIsInstance(blob, bytes)
+        self.assertEqual(blob + b'\0', blobs_92.init_hardcoded + b'\0')
+
+    def test_view_is_zero_copy(self):
+        registry = BlobRegistry()
+        view = registry.view(SupportedDevices.DEV_92, 'reset_blob')
+        self.assertIsInstance(view, memoryview)
+        self.assertIsInstance(view.obj, type(blob_store.default_store()._map))
+        self.assertEqual(bytes(view), blobs_92.reset_blob)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# =============================================================================
+# FLASH LAYOUT TESTS - Planner Against flash_layout_hardcoded
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Checks that flash_layout.plan_layout() reproduces the hardcoded
+#          0092 partition table on a 1 MiB flash, grows the template database
+#          on larger flash, and that init_flash() only plans a layout when it
+#          writes one.
+#
+# Operational Context:
+#   flash.py, sensor.py and tls.py are not part of this tree (they come from
+#   the python-validity package); stubs.py registers minimal stand-ins before
+#   python-modules is imported as validitysensor.
+#
+# Usage:
+#   python3 -m pytest device-files/tests
+#   python3 -m unittest discover device-files/tests
+# =============================================================================
+
+import types
+import unittest
+
+from stubs import load_package
+
+load_package()
+
+from validitysensor import flash_layout, init_flash  # noqa: E402
+
+MIB = 0x100000
+
+
+class FakeDevice:
+    idVendor = 0x138a
+    bus = 1
+    address = 2
+
+    def __init__(self, product):
+        self.idProduct = product
+
+
+class FakeUsb:
+    def __init__(self, product):
+        self.dev = FakeDevice(product)
+
+    def usb_dev(self):
+        return self.dev
+
+
+class PlanLayoutTest(unittest.TestCase):
+    def test_hardcoded_layout_is_valid(self):
+        flash_layout.validate_layout(init_flash.flash_layout_hardcoded, MIB, 0x1000)
+
+    def test_plan_reproduces_hardcoded_layout(self):
+        for policy in flash_layout.POLICIES:
+            for sector in (0x1000, 0):  # 0: flash IC reports no sector size
+                with self.subTest(policy=policy, sector=sector):
+                    self.assertEqual(flash_layout.plan_layout(MIB, sector, policy), init_flash.flash_layout_hardcoded)
+
+    def test_max_templates_uses_larger_flash(self):
+        layout = flash_layout.plan_layout(2 * MIB, 0x1000, 'max_templates')
+        templates = [p for p in layout if p.id == 4][0]
+        self.assertEqual(templates.offset + templates.size, 2 * MIB)
+        self.assertEqual(templates.size, 0x00052000 + MIB)
+
+    def test_fixed_keeps_nominal_sizes(self):
+        self.assertEqual(flash_layout.plan_layout(2 * MIB, 0x1000, 'fixed'), init_flash.flash_layout_hardcoded)
+
+    def test_flash_too_small(self):
+        with self.assertRaises(Exception):
+            flash_layout.plan_layout(MIB // 2, 0x1000, 'fixed')
+
+    def test_reserved_tail(self):
+        layout = flash_layout.plan_layout(2 * MIB, 0x1000, 'max_templates', reserved_tail=0x10000)
+        self.assertEqual(max(p.offset + p.size for p in layout), 2 * MIB - 0x10000)
+
+    def test_overlap_detected(self):
+        layout = list(init_flash.flash_layout_hardcoded)
+        layout[1] = layout[1]._replace(size=layout[1].size + 0x1000)
+        with self.assertRaises(Exception):
+            flash_layout.validate_layout(layout, MIB, 0x1000)
+
+
+class TargetLayoutTest(unittest.TestCase):
+    def setUp(self):
+        # Only the geometry of FlashInfo.ic is used
+        self.ic = types.SimpleNamespace(name='2 MiB', size=2 * MIB, secror_size=0x1000)
+
+    def test_signed_device_refuses_planned_layout(self):
+        info = init_flash.FlashInfo(self.ic, 0, 0, 0, 0, [])
+        with self.assertRaises(Exception):
+            init_flash.target_layout(info, 'max_templates', FakeUsb(0x0092))
+
+    def test_unsigned_device_accepts_planned_layout(self):
+        info = init_flash.FlashInfo(self.ic, 0, 0, 0, 0, [])
+        layout = init_flash.target_layout(info, 'max_templates', FakeUsb(0x0090))
+        self.assertNotEqual(layout, init_flash.flash_layout_hardcoded)
+
+    def test_partitioned_flash_does_not_plan(self):
+        # A signed device with a larger, already provisioned flash must start
+        # normally even with a layout policy configured
+        info = init_flash.FlashInfo(self.ic, 0, 0, 0, 0, list(init_flash.flash_layout_hardcoded))
+        session = types.SimpleNamespace(usb=FakeUsb(0x0092), tls=None)
+        saved = init_flash.get_flash_info, init_flash.default_session
+        init_flash.get_flash_info = lambda: info
+        init_flash.default_session = lambda: session
+        try:
+            init_flash.init_flash(layout_policy='max_templates', manifest=object())
+        finally:
+            init_flash.get_flash_info, init_flash.default_session = saved
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,213 @@
+# =============================================================================
+# REPLAY TESTS - Driver Flows Against fakeusb.ReplayDevice
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Runs send_init(), the warm start path, interrupt handling and
+#          differential re-provisioning against recorded device exchanges,
+#          so these flows are covered without a sensor attached.
+#
+# Operational Context:
+#   Traces are built in memory from TraceFrame tuples (strict replay: every
+#   command written must match the recording, and an unexpected command
+#   fails with a USBError). pyusb must be installed (ReplayDevice raises its
+#   USBError); flash.py, sensor.py and tls.py are stand-ins (see stubs.py).
+# =============================================================================
+
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import types
+import typing
+import unittest
+from binascii import unhexlify
+
+from stubs import load_package, require
+
+require('usb.core')
+load_package()
+
+from validitysensor import blobs_92, flash, init_flash  # noqa: E402
+from validitysensor.async_usb import AsyncUsb  # noqa: E402
+from validitysensor.fakeusb import ReplayDevice  # noqa: E402
+from validitysensor.flash_manifest import FlashManifest  # noqa: E402
+from validitysensor.usb import CancelledException, Usb  # noqa: E402
+from validitysensor.usb_trace import TraceFrame, TraceRecorder, load_trace  # noqa: E402
+from validitysensor.warm_start import WarmStartCache  # noqa: E402
+
+OK = b'\0\0'
+ROM_INFO = OK + b'rom info'
+FW_INFO = OK + b'\xc2\x8c\x74\x5a'
+NO_FWEXT = b'\xb0\x04'
+
+
+def frame(endpoint: int, payload: bytes) -> TraceFrame:
+    return TraceFrame(0, endpoint, len(payload), payload)
+
+
+def exchange(cmd: bytes, rsp: bytes) -> typing.List[TraceFrame]:
+    return [frame(1, cmd), frame(129, rsp)]
+
+
+def cold_init(fw_info=FW_INFO):
+    """Exchanges of a send_init() without a warm start entry."""
+    return (exchange(unhexlify('01'), ROM_INFO) + exchange(unhexlify('19'), OK) +
+            exchange(unhexlify('4302'), fw_info) + exchange(blobs_92.init_hardcoded, OK))
+
+
+def warm_init():
+    """Exchanges of a send_init() that hits the warm start cache."""
+    return exchange(unhexlify('4302'), FW_INFO) + exchange(blobs_92.init_hardcoded, OK)
+
+
+class ReplayTestCase(unittest.TestCase):
+    def open(self, frames, **kwargs) -> Usb:
+        usb = Usb()
+        usb.open_dev(ReplayDevice(frames, strict=True, **kwargs))
+        self.addCleanup(usb.close, error=True)
+        return usb
+
+
+class SendInitTest(ReplayTestCase):
+    def test_cold_init(self):
+        usb = self.open(cold_init())
+        usb.send_init()
+        self.assertEqual(usb.init_info, {'rom_info': ROM_INFO, '19': OK, 'fw_info': FW_INFO})
+
+    def test_clean_slate(self):
+        usb = self.open(cold_init(NO_FWEXT) + exchange(blobs_92.init_hardcoded_clean_slate, OK))
+        usb.send_init()
+
+    def test_recorded_trace_replays(self):
+        usb = self.open(cold_init())
+        usb.tracer = TraceRecorder()
+        usb.send_init()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'init.pcap')
+            usb.tracer.dump(path)
+            frames = load_trace(path)
+
+        self.assertEqual([(f.endpoint, f.payload) for f in frames], [(f.endpoint, f.payload) for f in cold_init()])
+        self.open(frames).send_init()
+
+    def test_device_time(self):
+        usb = self.open(cold_init(), latency=0.005)
+        usb.send_init()
+        self.assertAlmostEqual(usb.dev.device_time, 8 * 0.005)
+
+
+class WarmStartTest(ReplayTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'warm.json')
+
+    def start(self, frames, address):
+        usb = self.open(frames, address=address)
+        usb.warm_cache = WarmStartCache(self.path)
+        usb.send_init()
+        return usb
+
+    def test_reenumerated_device_hits_cache(self):
+        self.start(cold_init(), address=5)
+        usb = self.start(warm_init(), address=6)
+        self.assertEqual(usb.init_info['rom_info'], ROM_INFO)
+
+    def test_lost_fwext_drops_entry(self):
+        self.start(cold_init(), address=5)
+        frames = (exchange(unhexlify('4302'), NO_FWEXT) + cold_init(NO_FWEXT) +
+                  exchange(blobs_92.init_hardcoded_clean_slate, OK))
+        usb = self.start(frames, address=6)
+        self.assertEqual(usb.warm_cache.get(usb.warm_cache.device_key(usb.dev, usb.fw_hash)), None)
+
+
+class InterruptTest(ReplayTestCase):
+    def test_interrupt_after_command(self):
+        # The interrupt was recorded after the command: it is only raised once
+        # the command went out, while the wait is already in flight
+        usb = self.open(exchange(unhexlify('01'), ROM_INFO) + [frame(131, b'\x03')])
+        ausb = AsyncUsb(usb)
+        self.addCleanup(ausb.close)
+
+        async def run():
+            interrupt = asyncio.ensure_future(ausb.wait_int())
+            await asyncio.sleep(0.05)
+            self.assertFalse(interrupt.done())
+            self.assertEqual(await ausb.cmd(unhexlify('01')), ROM_INFO)
+            return await asyncio.wait_for(interrupt, 2)
+
+        self.assertEqual(asyncio.run(run()), b'\x03')
+
+    def test_cancel_wakes_wait_at_once(self):
+        usb = self.open([])
+        result = []
+
+        def wait():
+            try:
+                usb.wait_int()
+            except CancelledException:
+                result.append(time.monotonic())
+
+        thread = threading.Thread(target=wait)
+        thread.start()
+        time.sleep(0.05)
+        cancelled = time.monotonic()
+        usb.cancel()
+        thread.join(2)
+        self.assertEqual(len(result), 1)
+        self.assertLess(result[0] - cancelled, 0.5)
+
+
+class DifferentialReflashTest(ReplayTestCase):
+    class FakeTls:
+        secure_rx = secure_tx = False
+
+        def parse_tls_flash(self, data):
+            pass
+
+        def open(self):
+            self.secure_rx = self.secure_tx = True
+
+        def make_tls_flash(self):
+            return b'\x01' * 0x200
+
+    def setUp(self):
+        flash.calls.clear()
+        self.manifest = FlashManifest(None)
+        ic = types.SimpleNamespace(name='1 MiB', size=0x100000, secror_size=0x1000)
+        self.info = init_flash.FlashInfo(ic, 0, 0, 0, 0, list(init_flash.flash_layout_hardcoded))
+
+        saved = init_flash.get_flash_info, init_flash.default_session
+        self.addCleanup(setattr, init_flash, 'default_session', saved[1])
+        self.addCleanup(setattr, init_flash, 'get_flash_info', saved[0])
+        init_flash.get_flash_info = lambda: self.info
+
+    def use(self, usb: Usb):
+        session = types.SimpleNamespace(usb=usb, tls=self.FakeTls())
+        init_flash.default_session = lambda: session
+        return session
+
+    def test_serial_less_device_untouched(self):
+        # No frames: any command sent to the device fails the replay
+        self.use(self.open([]))
+        init_flash.init_flash(differential=True, manifest=self.manifest)
+        self.assertEqual(flash.calls, [])
+
+    def test_known_device_opens_tls_then_rewrites_cert(self):
+        usb = self.open(cold_init())
+        usb.dev.serial_number = '0123456789'
+        session = self.use(usb)
+
+        targets = dict.fromkeys(init_flash.partition_order)
+        targets[1] = b'\x02' * 0x200
+        self.manifest.record(self.manifest.device_key(usb.dev), self.info.partitions, targets)
+
+        init_flash.init_flash(differential=True, manifest=self.manifest)
+        self.assertTrue(session.tls.secure_tx)
+        self.assertEqual(flash.calls, [('erase', 1), ('write', 1, 0, session.tls.make_tls_flash())])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# =============================================================================
+# DIFFERENTIAL RE-PROVISIONING TESTS - init_flash(differential=True)
+# =============================================================================
+# Author: merneo (based on python-validity project)
+# Purpose: Checks that differential re-provisioning leaves sensors unknown to
+#          the flash manifest (and sensors without a serial number) alone,
+#          opens the TLS session before it builds the cert partition and
+#          rewrites only what changed.
+#
+# Operational Context:
+#   The flash.py stand-in (see stubs.py) records erase/write calls in
+#   flash.calls; the TLS context is a fake that only tracks its state.
+# =============================================================================
+
+import types
+import unittest
+
+from stubs import load_package
+
+load_package()
+
+from validitysensor import flash, init_flash  # noqa: E402
+from validitysensor.flash_manifest import FlashManifest  # noqa: E402
+
+CERT = b'\x01' * 0x200
+
+
+class FakeDevice:
+    idVendor = 0x138a
+    idProduct = 0x0092
+    bus = 1
+    address = 2
+
+    def __init__(self, serial):
+        self.serial_number = serial
+
+
+class FakeUsb:
+    def __init__(self, serial):
+        self.dev = FakeDevice(serial)
+        self.inits = 0
+
+    def usb_dev(self):
+        return self.dev
+
+    def send_init(self):
+        self.inits += 1
+
+    def invalidate_warm_start(self):
+        pass
+
+
+class FakeTls:
+    def __init__(self):
+        self.secure_rx = self.secure_tx = False
+        self.flash = None
+
+    def parse_tls_flash(self, data):
+        self.flash = data
+
+    def open(self):
+        self.secure_rx = self.secure_tx = True
+
+    def make_tls_flash(self):
+        if not (self.secure_rx and self.secure_tx):
+            raise Exception('TLS session not open')
+        return CERT
+
+
+class ReprovisionTest(unittest.TestCase):
+    def setUp(self):
+        flash.calls.clear()
+        self.layout = list(init_flash.flash_layout_hardcoded)
+        ic = types.SimpleNamespace(name='1 MiB', size=0x100000, secror_size=0x1000)
+        self.info = init_flash.FlashInfo(ic, 0, 0, 0, 0, self.layout)
+        self.manifest = FlashManifest(None)
+        self.saved = init_flash.default_session
+
+    def tearDown(self):
+        init_flash.default_session = self.saved
+
+    def use_device(self, serial):
+        session = types.SimpleNamespace(usb=FakeUsb(serial), tls=FakeTls())
+        init_flash.default_session = lambda: session
+        return session
+
+    def test_serial_less_device_is_left_alone(self):
+        session = self.use_device(None)
+        self.assertEqual(init_flash.reprovision_flash(self.info, manifest=self.manifest), [])
+        self.assertEqual(flash.calls, [])
+        self.assertFalse(session.tls.secure_tx)
+
+    def test_unknown_device_is_left_alone(self):
+        self.use_device('1234')
+        self.assertEqual(init_flash.reprovision_flash(self.info, manifest=self.manifest), [])
+        self.assertEqual(flash.calls, [])
+
+    def test_force_erases_everything(self):
+        session = self.use_device('1234')
+        changed = init_flash.reprovision_flash(self.info, manifest=self.manifest, force=True)
+        self.assertEqual(changed, list(init_flash.partition_order))
+        self.assertEqual([c for c in flash.calls if c[0] == 'write'], [('write', 1, 0, CERT)])
+        self.assertTrue(self.manifest.known(self.manifest.device_key(session.usb.dev), self.layout))
+
+    def test_known_device_rewrites_changed_cert_only(self):
+        session = self.use_device('1234')
+        key = self.manifest.device_key(session.usb.dev)
+        targets = dict.fromkeys(init_flash.partition_order)
+        targets[1] = b'\x02' * 0x200  # cert before a rotation
+        self.manifest.record(key, self.layout, targets)
+
+        changed = init_flash.reprovision_flash(self.info, manifest=self.manifest)
+        self.assertEqual(changed, [1])
+        self.assertEqual(session.usb.inits, 1)
+        self.assertEqual(session.tls.flash, b'tls flash')
+        self.assertEqual(flash.calls, [('erase', 1), ('write', 1, 0, CERT)])
+
+        flash.calls.clear()
+        self.assertEqual(init_flash.reprovision_flash(self.info, manifest=self.manifest), [])
+        self.assertEqual(flash.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()